@@ -0,0 +1,200 @@
+"""
+This proxy caches the results of the coroutine methods of the proxied
+object, in an asynchronous cache backend.
+
+>>> import asyncio
+>>> from pussycache.async_proxy import AsyncProxy
+>>> from pussycache.cache import BaseCacheBackend
+>>> from pussycache.cache.async_backend import AsyncCacheBackend
+>>> class MyClass(object):
+...     async def a_long_task(self, delta):
+...         await asyncio.sleep(delta)
+...         return delta
+...     async def forget_about_time(self):
+...         pass
+>>> cache_proxy = AsyncProxy(
+...     MyClass(), cache=AsyncCacheBackend(BaseCacheBackend(30)),
+...     cached_methods=["a_long_task"],
+...     invalidate_methods={"forget_about_time": ["a_long_task"]})
+>>> asyncio.run(cache_proxy.a_long_task(0.1))
+0.1
+"""
+import asyncio
+from functools import wraps
+from inspect import iscoroutinefunction
+from timeit import default_timer
+
+from .cache import (GENERATION_TIMEOUT, InvalidationRules, jittered,
+                    new_generation)
+from .keys import KeyBuilder, UncacheableArgument
+from .proxy import BaseProxy
+
+
+def async_cachedecorator(method, cache, timeout=None, jitter=None,
+                         negative_timeout=None, key_builder=None,
+                         key_args=None, stats=None):
+    """Cache the results of the coroutine ``method`` into the asynchronous
+    ``cache``.
+
+    Results are stored like :func:`pussycache.cache.cachedecorator` does.
+    On a miss, the concurrent calls with the same key await the same
+    computation.
+
+    :param timeout: time to live of the results, defaults to the cache
+                    timeout
+
+    :param jitter: fraction of the time to live, the results expire up to
+                   that much earlier at random
+
+    :param negative_timeout: time to live of the ``None`` results, defaults
+                             to ``timeout``
+
+    :param key_builder: the :class:`pussycache.keys.KeyBuilder` of the keys
+
+    :param key_args: names of the arguments forming the keys
+
+    :param stats: the :class:`pussycache.stats.MethodStats` recording the
+                  hits, misses and latency of the method
+    """
+    key_builder = key_builder or KeyBuilder()
+    build_key = key_builder.builder(method, key_args)
+    method_generation_key = key_builder.generation_key(method.__name__)
+    timeout = timeout or getattr(cache, "timeout", None)
+    in_flight = {}
+
+    async def lookup(key):
+        values = await cache.get_many([method_generation_key, key])
+        generation = values.get(method_generation_key)
+        entry = values.get(key)
+        if generation is not None and entry is not None \
+                and entry[0] == generation:
+            return generation, entry
+        return generation, None
+
+    async def fill(key, generation, args, kwargs):
+        start = default_timer()
+        result = await method(*args, **kwargs)
+        if stats is not None:
+            stats.origin.observe(default_timer() - start)
+        if generation is None:
+            generation = new_generation()
+            if not await cache.add(method_generation_key, generation,
+                                   GENERATION_TIMEOUT):
+                return result  # not cached, it may be outdated already
+        ttl = timeout
+        if result is None and negative_timeout:
+            ttl = negative_timeout
+        if jitter and ttl:
+            ttl = jittered(ttl, jitter)
+        await cache.set(key, (generation, result, None), ttl)
+        return result
+
+    def done(key, future):
+        if in_flight.get(key) is future:
+            del in_flight[key]
+
+    @wraps(method)
+    async def wrapper(*args, **kwargs):
+        try:
+            key = build_key(args, kwargs)
+        except UncacheableArgument:
+            return await method(*args, **kwargs)
+        generation, entry = await lookup(key)
+        if entry is not None:
+            if stats is not None:
+                stats.hits += 1
+            return entry[1]
+        if stats is not None:
+            stats.misses += 1
+        future = in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(
+                fill(key, generation, args, kwargs))
+            in_flight[key] = future
+            future.add_done_callback(lambda future: done(key, future))
+        # A cancelled caller does not cancel the others' computation
+        return await asyncio.shield(future)
+
+    return wrapper
+
+
+def async_invalidator(method, invalidator_methods, cache, key_builder=None,
+                      stats=None, key_args=None, owner=None):
+    """Invalidate the cached results of the methods listed in
+    ``invalidator_methods[method.__name__]`` whenever the coroutine
+    ``method`` is called, before and after it, like
+    :func:`pussycache.cache.invalidator`."""
+    key_builder = key_builder or KeyBuilder()
+    rules = InvalidationRules(method, invalidator_methods[method.__name__],
+                              key_builder, key_args, owner)
+
+    async def write(result, keys, generations):
+        if rules.written_generation_keys:
+            generations = dict(generations)
+            generations.update(
+                await cache.get_many(rules.written_generation_keys))
+        entries, new_generations = rules.entries(result, keys, generations)
+        if new_generations:
+            await cache.set_many(new_generations, GENERATION_TIMEOUT)
+        for timeout, values in entries.items():
+            await cache.set_many(values, timeout)
+
+    async def invalidate(deleted):
+        generations = {}
+        if rules.methods:
+            generations = rules.generations()
+            await cache.set_many(generations, GENERATION_TIMEOUT)
+        if deleted:
+            await cache.delete_many(deleted)
+        return generations
+
+    @wraps(method)
+    async def wrapper(*args, **kwargs):
+        keys = rules.keys(args, kwargs)
+        deleted = [key for key in keys if key is not None]
+        if stats is not None:
+            stats.invalidations += 1
+            stats.invalidated_methods += len(rules.methods)
+            stats.invalidated_keys += len(deleted)
+        await invalidate(deleted)
+        result = await method(*args, **kwargs)
+        generations = await invalidate(deleted)
+        if rules.writes:
+            await write(result, keys, generations)
+        return result
+    return wrapper
+
+
+class AsyncProxy(BaseProxy):
+    """
+    A :class:`pussycache.proxy.BaseProxy` of coroutine methods.
+
+    :param cache: is an asynchronous cache backend, like
+                  :class:`pussycache.cache.async_backend.AsyncCacheBackend`
+                  or :class:`pussycache.cache.async_redis_backend.\
+AsyncRedisCacheBackend`
+
+    The cached and invalidating methods must be coroutine functions, the
+    options of the cached methods are the ones of
+    :func:`async_cachedecorator`.
+    """
+
+    def cache_method(self, method, options):
+        check_coroutine(method)
+        return async_cachedecorator(method, self._cache,
+                                    key_builder=self._key_builder,
+                                    stats=self._method_stats(method),
+                                    **options)
+
+    def invalidating_method(self, method, owner=None):
+        check_coroutine(method)
+        return async_invalidator(method, self._invalidate_methods,
+                                 self._cache, self._key_builder,
+                                 self._method_stats(method),
+                                 self._key_args(), owner)
+
+
+def check_coroutine(method):
+    if not iscoroutinefunction(method):
+        raise TypeError("%s is not a coroutine function, it cannot be "
+                        "proxied by an AsyncProxy" % method.__name__)
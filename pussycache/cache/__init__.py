@@ -1,10 +1,56 @@
-import calendar
-import datetime
+import heapq
+import inspect
+import itertools
+import random
+import sys
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
 from functools import wraps
 
+from pussycache.keys import KeyBuilder, UncacheableArgument, takes_self
+from pussycache.refresh import get_default_executor
+from pussycache.stats import InstrumentedCache, timed
+
+# Generations outlive the entries computed in them: an expired generation
+# gets renewed, which invalidates all the entries of its method.
+GENERATION_TIMEOUT = 7 * 24 * 3600
+
+# Entries of the former expiry heap moved to the new one on each write,
+# while it is compacted
+COMPACT_BATCH = 16
+
+
+class _Missing(object):
+    """Type of ``MISSING``"""
+
+    def __repr__(self):
+        return "MISSING"
+
+
+#: Default value telling a cache miss from a cached ``None``
+MISSING = _Missing()
+
 
 def get_now_timestamp():
-    return calendar.timegm(datetime.datetime.now().utctimetuple())
+    """Return the current UTC timestamp, in seconds"""
+    return time.time()
+
+
+def _sizeof(key, value):
+    """Approximate size of a cache entry, in bytes"""
+    return sys.getsizeof(key) + _valuesize(value)
+
+
+def _valuesize(value):
+    # The values are stored as is: count the results held by the entries
+    # of the cached methods, and the memory viewed by memory views or
+    # arrays (``nbytes``) even when it is not their own
+    if isinstance(value, tuple):
+        return sys.getsizeof(value) + sum(_valuesize(item) for item in value)
+    return max(sys.getsizeof(value), getattr(value, "nbytes", 0))
 
 
 class BaseCacheBackend(object):
@@ -23,6 +69,7 @@ class BaseCacheBackend(object):
     'has expired'
     >>> cache.set('add_key', 'Initial value')
     >>> cache.add('add_key', 'New value')
+    False
     >>> cache.get('add_key')
     'Initial value'
     >>> cache.delete('add_key')
@@ -43,103 +90,882 @@ class BaseCacheBackend(object):
     >>> cache.get('a')
 
     >>> cache.clear()
+
+    ``None`` and falsy values are cached too, use a sentinel as default
+    value to tell them from a miss:
+
+    >>> from pussycache.cache import MISSING
+    >>> cache.set('nothing', None)
+    >>> cache.get('nothing', MISSING)
+
+    >>> cache.get('unknown', MISSING)
+    MISSING
+    >>> cache.get('unknown', 0)
+    0
+    >>> cache.get_many(['nothing', 'unknown'])
+    {'nothing': None}
+    >>> cache.clear()
+
+    The store can be bounded, either by a number of entries or by an
+    approximate size in bytes. The least recently used entries are
+    evicted first.
+
+    >>> cache = BaseCacheBackend(100, max_entries=2)
+    >>> cache.set('a', 1)
+    >>> cache.set('b', 2)
+    >>> cache.get('a')
+    1
+    >>> cache.set('c', 3)
+    >>> cache.get('b')
+
+    >>> sorted(cache.store.keys())
+    ['a', 'c']
+    >>> cache.evictions
+    1
+
+    Expired entries are reclaimed incrementally, the ones expiring first,
+    on each ``get``/``set``, or all at once with ``purge_expired``.
+    ``sweep_interval`` starts a background thread doing it periodically.
+
+    Expiry follows a monotonic clock, with sub-second resolution, which can
+    be replaced:
+
+    >>> now = [0]
+    >>> cache = BaseCacheBackend(100, clock=lambda: now[0])
+    >>> cache.set('a', 1, 0.5)
+    >>> now[0] = 0.4
+    >>> cache.get('a')
+    1
+    >>> now[0] = 0.5
+    >>> cache.get('a')
+
     """
 
-    def __init__(self, timeout, *args, **kwargs):
+    def __init__(self, timeout, max_entries=None, max_size=None,
+                 sizeof=None, expire_batch=10, sweep_interval=None,
+                 thread_safe=False, clock=None, *args, **kwargs):
+        """
+        :param timeout: default time to live of the entries, in seconds
+
+        :param max_entries: maximum number of entries kept in the store
+
+        :param max_size: approximate maximum size of the store, in bytes
+
+        :param sizeof: callable returning the size of a key/value pair,
+                       defaults to :func:`sys.getsizeof` of both
+
+        :param expire_batch: maximum number of expiries, of the entries or
+                             of their former timeouts, handled on each
+                             ``get``/``set``
+
+        :param sweep_interval: if set, expired entries are also reclaimed
+                               every ``sweep_interval`` seconds by a
+                               background thread
+
+        :param thread_safe: guard the store with a lock, so that it can be
+                            shared by several threads
+
+        :param clock: function returning the current time in seconds,
+                      defaults to :func:`time.monotonic`
+        """
         self.timeout = timeout
-        self.store = {}
+        self.clock = clock or time.monotonic
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.sizeof = sizeof or _sizeof
+        self.expire_batch = expire_batch
+        self.store = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+        self.expirations = 0
+        # Min-heap of (expiry timestamp, sequence, key), entries of keys
+        # set again or deleted since are skipped when popped. Once they
+        # outnumber the live ones, the heap is replaced by a new one and
+        # its live entries are moved to it a few at a time.
+        self._expiries = []
+        self._former_expiries = []
+        self._sequence = itertools.count()
+        self._lock = _NoLock()
+        if thread_safe or sweep_interval:
+            self._lock = threading.RLock()
+        self._sweeper = None
+        if sweep_interval:
+            self._sweeper = _Sweeper(self, sweep_interval)
+            self._sweeper.start()
+
+    @property
+    def bounded(self):
+        return bool(self.max_entries or self.max_size)
 
     def clear(self):
         """Clear all the cache"""
-        self.store = {}
+        with self._lock:
+            self.store = OrderedDict()
+            self.size = 0
+            self._expiries = []
+            self._former_expiries = []
 
     def set(self, key, value, timeout=None):
         """Add a key/value to the store """
-        expired = get_now_timestamp() + (timeout or self.timeout)
-        self.store[key] = {"value": value,
-                           "timeout": expired}
+        now = self.clock()
+        with self._lock:
+            self._store_entry(key, value, now + (timeout or self.timeout))
+            self._expire(now, self.expire_batch)
 
-    def get(self, key, default_value=None):
-        """return the value corresponding to the key or None if
-        expired or does not exist """
+    def _store_entry(self, key, value, expired):
+        """Store an entry, evicting the least recently used ones if the
+        store gets over its limits"""
+        self._delete(key)
+        entry = {"value": value, "timeout": expired}
+        if self.bounded:
+            entry["size"] = self.sizeof(key, value)
+            if self.max_size and entry["size"] > self.max_size:
+                return  # would evict the whole store, do not keep it
+            self.size += entry["size"]
+        self.store[key] = entry
+        heapq.heappush(self._expiries, (expired, next(self._sequence), key))
+        if self.bounded:
+            self._evict()
+        if self._former_expiries:
+            self._compact(COMPACT_BATCH)
+        elif len(self._expiries) > 2 * len(self.store) + 64:
+            self._former_expiries = self._expiries
+            self._expiries = []
+
+    def _evict(self):
+        """Pop the least recently used entries until the store fits in
+        its limits"""
+        while self.store and (
+                (self.max_entries and len(self.store) > self.max_entries) or
+                (self.max_size and self.size > self.max_size)):
+            key, entry = self.store.popitem(last=False)
+            self.size -= entry["size"]
+            self.evictions += 1
 
+    def _expire(self, now, limit=None):
+        """Handle at most ``limit`` expiries, the first ones, return the
+        number of entries reclaimed.
+
+        The expiries of keys set again or deleted count too, so that no
+        call pays for many of them."""
+        count = 0
+        popped = 0
+        while limit is None or popped < limit:
+            expiries = self._expiries
+            former = self._former_expiries
+            if former and (not expiries or former[0] < expiries[0]):
+                expiries = former
+            if not expiries or expiries[0][0] > now:
+                break
+            expired, _, key = heapq.heappop(expiries)
+            popped += 1
+            entry = self.store.get(key)
+            if entry is not None and entry["timeout"] == expired:
+                self._delete(key)
+                self.expirations += 1
+                count += 1
+        return count
+
+    def _compact(self, limit):
+        """Move at most ``limit`` live entries of the former expiry heap to
+        the current one, dropping the others.
+
+        They are taken from the end of the heap, which keeps it a heap."""
+        former = self._former_expiries
+        for _ in range(min(limit, len(former))):
+            item = former.pop()
+            entry = self.store.get(item[2])
+            if entry is not None and entry["timeout"] == item[0]:
+                heapq.heappush(self._expiries, item)
+
+    def purge_expired(self):
+        """Remove all the expired entries from the store, return how many
+        were removed"""
+        with self._lock:
+            return self._expire(self.clock())
+
+    def _get(self, key, default_value, now):
         try:
             value = self.store[key]
         except KeyError:
-            return default_value or None
+            return default_value
 
-        if value["timeout"] <= get_now_timestamp():
-            self.delete(key)
-            return default_value or None
+        if value["timeout"] <= now:
+            self._delete(key)
+            self.expirations += 1
+            return default_value
         else:
+            if self.bounded:
+                # Mark the entry as the most recently used one.
+                self.store[key] = self.store.pop(key)
             return value["value"]
 
-    def delete(self, key):
-        """Remove a key/value from the store """
+    def get(self, key, default_value=None):
+        """return the value corresponding to the key or
+        ``default_value`` if expired or does not exist """
+        now = self.clock()
+        with self._lock:
+            self._expire(now, self.expire_batch)
+            return self._get(key, default_value, now)
+
+    def _delete(self, key):
         try:
-            self.store.pop(key)
+            entry = self.store.pop(key)
         except KeyError:
             pass  # we do not mind if the key does not exist
+        else:
+            self.size -= entry.get("size", 0)
+
+    def delete(self, key):
+        """Remove a key/value from the store """
+        with self._lock:
+            self._delete(key)
         return None
 
     def add(self, key, value, timeout=None):
-        """Add a key/value to the store unless this key already exists """
-        val = self.get(key)
-        if val is None:
-            self.set(key, value, timeout=timeout)
+        """Add a key/value to the store unless this key already exists,
+        return whether it has been added"""
+        with self._lock:
+            if self.get(key, MISSING) is MISSING:
+                self.set(key, value, timeout=timeout)
+                return True
+            return False
 
     def set_many(self, valuesdict, timeout=None):
-        expired = get_now_timestamp() + (timeout or self.timeout)
-        for k, v in valuesdict.items():
-            self.store[k] = {"value": v,
-                             "timeout": expired}
+        now = self.clock()
+        expired = now + (timeout or self.timeout)
+        with self._lock:
+            for k, v in valuesdict.items():
+                self._store_entry(k, v, expired)
+            self._expire(now, self.expire_batch)
 
     def get_many(self, keys, timeout=None):
+        """Return a dict of the values of the given keys, the keys expired
+        or which do not exist are left out"""
+        now = self.clock()
         response = {}
-        for elem in keys:
-            response[elem] = self.get(elem)
+        with self._lock:
+            self._expire(now, self.expire_batch)
+            for elem in keys:
+                value = self._get(elem, MISSING, now)
+                if value is not MISSING:
+                    response[elem] = value
         return response
 
     def delete_many(self, keys):
-        for elem in keys:
-            self.delete(elem)
+        with self._lock:
+            for elem in keys:
+                self._delete(elem)
+
+    def stop_sweeper(self):
+        """Stop the background thread reclaiming expired entries"""
+        if self._sweeper is not None:
+            self._sweeper.stop()
+            self._sweeper = None
+
+
+class _NoLock(object):
+    """Stands for a lock when the store is only used from one thread"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
 
+class _Sweeper(threading.Thread):
+    """Daemon thread reclaiming the expired entries of a cache backend.
 
-def cachedecorator(method, cache):
+    Only a weak reference to the backend is kept, so the thread stops
+    once the backend is garbage collected.
+    """
+
+    def __init__(self, cache, interval):
+        super(_Sweeper, self).__init__(name="pussycache-sweeper")
+        self.daemon = True
+        self.cache = weakref.ref(cache)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            cache = self.cache()
+            if cache is None:
+                return
+            cache.purge_expired()
+            del cache
+
+    def stop(self):
+        self.stopped.set()
+
+
+def new_generation():
+    """Return a new, unique generation token"""
+    return uuid.uuid4().hex
+
+
+def create_generation(cache, key):
+    """Create the missing generation stored at ``key``, return it, or None
+    if another one was stored meanwhile: by a concurrent first fill, or by
+    an invalidation which the result about to be cached may predate"""
+    generation = new_generation()
+    if cache.add(key, generation, GENERATION_TIMEOUT):
+        return generation
+    return None
+
+
+def jittered(timeout, jitter):
+    """Return ``timeout`` shortened by up to ``jitter`` times itself, at
+    random, so that the entries set together do not expire together.
+
+    The times to live may be fractions of a second, they are kept over a
+    millisecond."""
+    return max(timeout - random.random() * jitter * timeout, 0.001)
+
+
+class RecentKeys(object):
+    """Keys of the most recently used results of a method, telling which
+    ones to remove from the cache to keep at most ``max_entries`` of
+    them"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def touch(self, key):
+        """Mark ``key`` as the most recently used one, return the least
+        recently used keys over ``max_entries``"""
+        with self._lock:
+            self.keys.pop(key, None)
+            self.keys[key] = True
+            evicted = []
+            while len(self.keys) > self.max_entries:
+                evicted.append(self.keys.popitem(last=False)[0])
+        return evicted
+
+
+class SingleFlight(object):
+    """Run a function only once at a time per key.
+
+    Threads calling ``do`` with a key already being computed wait for that
+    computation and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class _Call(object):
+    """A computation in flight"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def cachedecorator(method, cache, single_flight=False, lock_timeout=None,
+                   lock_wait=None, timeout=None, jitter=None,
+                   max_entries=None, negative_timeout=None,
+                   soft_timeout=None, refresh_ahead=None,
+                   refresh_executor=None, key_builder=None, key_args=None,
+                   stats=None):
+    """Cache the results of ``method`` into ``cache``.
+
+    Results are stored along with the generation of the method they were
+    computed in, and the time they should be refreshed at. Looking a
+    result up costs one ``get_many`` of both the result and the current
+    generation, a result from another generation is a miss.
+
+    :param single_flight: on a miss, only one thread computes the result,
+                          the others wait for it
+
+    :param lock_timeout: with ``single_flight``, if the cache backend has a
+                         ``lock`` method, only one process computes the
+                         result too. The lock is released after
+                         ``lock_timeout`` seconds at most.
+
+    :param lock_wait: seconds the other processes wait for the lock before
+                      computing the result themselves, defaults to
+                      ``lock_timeout``
+
+    :param timeout: time to live of the results, defaults to the cache
+                    timeout
+
+    :param jitter: fraction of the time to live, the results expire up to
+                   that much earlier at random, eg: ``0.1``
+
+    :param max_entries: maximum number of results of the method kept in the
+                        cache, the least recently used ones in this
+                        process are removed first
+
+    :param negative_timeout: time to live of the ``None`` results, defaults
+                             to ``timeout``
+
+    :param soft_timeout: seconds after which a result is stale. Stale
+                         results are still returned until they expire
+                         from the cache, and get refreshed in the
+                         background meanwhile.
+
+    :param refresh_ahead: seconds before a result gets stale (or expires,
+                          without ``soft_timeout``) from which a hit
+                          refreshes it in the background
+
+    :param refresh_executor: the
+                             :class:`pussycache.refresh.RefreshExecutor`
+                             running the background refreshes
+
+    :param key_builder: the :class:`pussycache.keys.KeyBuilder` of the keys
+
+    :param key_args: names of the arguments forming the keys, defaults to
+                     the ones declared with
+                     :func:`pussycache.keys.cache_key_args`, or all of them
+
+    :param stats: the :class:`pussycache.stats.MethodStats` recording the
+                  hits, misses and latencies of the method
+    """
+    key_builder = key_builder or KeyBuilder()
+    build_key = key_builder.builder(method, key_args)
+    method_generation_key = key_builder.generation_key(method.__name__)
+    origin = method
+    if stats is not None:
+        cache = InstrumentedCache(cache, stats)
+        origin = timed(method, stats.origin)
+    flight = SingleFlight() if single_flight else None
+    distributed = bool(single_flight and lock_timeout and
+                       hasattr(cache, "lock"))
+    timeout = timeout or getattr(cache, "timeout", None)
+    recent_keys = RecentKeys(max_entries) if max_entries else None
+    fresh_for = soft_timeout or timeout
+    if fresh_for and refresh_ahead:
+        fresh_for = max(fresh_for - refresh_ahead, 0)
+    elif not soft_timeout:
+        fresh_for = None  # results are fresh until they expire
+    if fresh_for is not None and refresh_executor is None:
+        refresh_executor = get_default_executor()
+
+    def lookup(key):
+        """Return the current generation and the cached entry, if it is
+        from that generation"""
+        values = cache.get_many([method_generation_key, key])
+        generation = values.get(method_generation_key)
+        entry = values.get(key)
+        if generation is not None and entry is not None \
+                and entry[0] == generation:
+            return generation, entry
+        return generation, None
+
+    def fill(key, generation, args, kwargs):
+        result = origin(*args, **kwargs)
+        if generation is None:
+            generation = create_generation(cache, method_generation_key)
+            if generation is None:
+                return result  # not cached, it may be outdated already
+        refresh_at = None
+        if fresh_for is not None:
+            refresh_at = time.time() + fresh_for
+        ttl = timeout
+        if result is None and negative_timeout:
+            ttl = negative_timeout
+        if jitter and ttl:
+            ttl = jittered(ttl, jitter)
+        cache.set(key, (generation, result, refresh_at), ttl)
+        if recent_keys is not None:
+            evicted = recent_keys.touch(key)
+            if evicted:
+                cache.delete_many(evicted)
+        return result
+
+    def refresh(key, args, kwargs):
+        """Compute the result again, unless another process is doing it
+        or did it already"""
+        lock = None
+        if distributed:
+            lock = cache.lock(key, lock_timeout, 0)
+            if not lock.acquire():
+                return
+        try:
+            generation, entry = lookup(key)
+            if entry is not None and (entry[2] is None or
+                                      entry[2] > time.time()):
+                return
+            fill(key, generation, args, kwargs)
+        finally:
+            if lock is not None:
+                lock.release()
+
+    def load(key, args, kwargs):
+        """Compute the result, unless another thread or process did it
+        while we were waiting"""
+        lock = None
+        if distributed:
+            lock = cache.lock(key, lock_timeout, lock_wait or lock_timeout)
+            if not lock.acquire():
+                lock = None  # waited long enough, compute it anyway
+        try:
+            generation, entry = lookup(key)
+            if entry is not None:
+                return entry[1]
+            return fill(key, generation, args, kwargs)
+        finally:
+            if lock is not None:
+                lock.release()
 
     @wraps(method)
     def wrapper(*args, **kwargs):
-        kwgs = sorted(kwargs.items(), key=lambda x: x[0])
-        key = "".join((method.__name__, str(args), str(kwgs)))
-        result = cache.get(key)
-        if result is None:
-            result = method(*args, **kwargs)
-            cache.set(key, result)
-
-        func_list = cache.get("methods_list")
-        if func_list is None:
-            func_list = []
-        if key not in func_list:
-            func_list.append(key)
-        cache.set("methods_list", func_list, 3600)
-        return result
+        try:
+            key = build_key(args, kwargs)
+        except UncacheableArgument:
+            return method(*args, **kwargs)
+        generation, entry = lookup(key)
+        if entry is not None:
+            if stats is not None:
+                stats.hits += 1
+            if recent_keys is not None:
+                recent_keys.touch(key)
+            if entry[2] is not None and entry[2] <= time.time():
+                refresh_executor.submit(
+                    key, lambda: refresh(key, args, kwargs))
+            return entry[1]
+        if stats is not None:
+            stats.misses += 1
+        if flight is None:
+            return fill(key, generation, args, kwargs)
+        return flight.do(key, lambda: load(key, args, kwargs))
+
+    return wrapper
+
+
+def _argument_position(method, name):
+    """Return the position of the argument ``name`` of ``method``, or of
+    its first argument after ``self`` if ``name`` is True"""
+    if name is True:
+        return 1 if takes_self(method) else 0
+    return list(inspect.signature(method).parameters).index(name)
+
+
+def batchdecorator(method, cache, batch=True, result="dict", timeout=None,
+                   jitter=None, negative_timeout=None, key_builder=None,
+                   key_args=None, stats=None):
+    """Cache the results of ``method``, taking a list of items, per item.
+
+    The results of the items are looked up with one ``get_many``, the
+    method is called with the missing items only, and their results are
+    written with one ``set_many``. Calling it with ``[1, 2]`` then with
+    ``[2, 3]`` only computes the result of ``3`` the second time.
+
+    :param batch: name of the argument holding the items, ``True`` for the
+                  first one
+
+    :param result: ``"dict"`` if the method returns a dict of the results
+                   per item, the items it leaves out are cached as
+                   ``None`` results, and the ``None`` results are left out
+                   of the dict; ``"list"`` if it returns the list of the
+                   results, in the order of the items
+
+    The items may be any iterable, the method is called with lists of
+    them, or as is with unhashable items.
+
+    The other parameters are the ones of :func:`cachedecorator`, the keys
+    are the ones of the method called with a single item.
+    """
+    if result not in ("dict", "list"):
+        raise ValueError("result must be 'dict' or 'list', not %r"
+                         % (result,))
+    key_builder = key_builder or KeyBuilder()
+    build_key = key_builder.builder(method, key_args)
+    method_generation_key = key_builder.generation_key(method.__name__)
+    position = _argument_position(method, batch)
+    timeout = timeout or getattr(cache, "timeout", None)
+    origin = method
+    if stats is not None:
+        cache = InstrumentedCache(cache, stats)
+        origin = timed(method, stats.origin)
+
+    def replace(args, kwargs, items):
+        """Return ``args`` and ``kwargs`` with the items replaced"""
+        if batch is not True and batch in kwargs:
+            kwargs = dict(kwargs)
+            kwargs[batch] = items
+        else:
+            args = args[:position] + (items,) + args[position + 1:]
+        return args, kwargs
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        if batch is not True and batch in kwargs:
+            items = kwargs[batch]
+        else:
+            items = args[position]
+        items = list(items)  # an iterator can only be read once
+        args, kwargs = replace(args, kwargs, items)
+        try:
+            keys = [build_key(*replace(args, kwargs, item)) for item in items]
+            set(items)  # the results are matched to the items by value
+        except TypeError:  # an UncacheableArgument, or unhashable items
+            return method(*args, **kwargs)
+        values = cache.get_many([method_generation_key] + keys)
+        generation = values.get(method_generation_key)
+        results = {}
+        missing = []
+        seen = set()
+        for item, key in zip(items, keys):
+            entry = values.get(key)
+            if generation is not None and entry is not None \
+                    and entry[0] == generation:
+                results[item] = entry[1]
+            elif item not in seen:
+                missing.append(item)
+            seen.add(item)
+        if stats is not None:
+            stats.hits += len(seen) - len(missing)
+            stats.misses += len(missing)
+        if missing:
+            missing_args, missing_kwargs = replace(args, kwargs, missing)
+            computed = origin(*missing_args, **missing_kwargs)
+            if result == "list":
+                computed = dict(zip(missing, computed))
+            if generation is None:
+                generation = create_generation(cache, method_generation_key)
+            entries = {}
+            negative_entries = {}
+            for item, key in zip(items, keys):
+                if item not in results:
+                    value = computed.get(item)
+                    if value is None and negative_timeout:
+                        negative_entries[key] = (generation, value, None)
+                    else:
+                        entries[key] = (generation, value, None)
+                    results[item] = value
+            for values, ttl in ((entries, timeout),
+                                (negative_entries, negative_timeout)):
+                if values and generation is not None:
+                    if jitter and ttl:
+                        ttl = jittered(ttl, jitter)
+                    cache.set_many(values, ttl)
+        if result == "list":
+            return [results.get(item) for item in items]
+        return dict((item, results[item]) for item in items
+                    if results[item] is not None)
 
     return wrapper
 
 
-def invalidator(method, invalidator_methods, cache):
+class InvalidationRules(object):
+    """The cached results invalidated, or written, by the calls of
+    ``method``.
+
+    :param rules: names of the methods whose results are all invalidated,
+                  or dicts invalidating the result of one call of a method,
+                  built from the arguments of the call of ``method``:
+                  ``{"method": "get_user", "kwargs": {"user": "name"}}``
+                  invalidates ``get_user(user=name)``. ``"args"`` gives
+                  positional arguments. Arguments are either names of the
+                  arguments of ``method``, or functions of the dict of
+                  these arguments. A ``ValueError`` is raised if
+                  ``method`` has no such argument.
+
+    A dict with ``"write": True`` writes the result of ``method`` as the
+    result of that call, instead of only invalidating it, or what
+    ``"write"`` returns if it is a function of the result. ``"timeout"``
+    is the time to live of the written results.
+
+    The keys are built like the ones of the cached methods, from the
+    methods of the object ``method`` is bound to.
+
+    :param key_args: names of the arguments forming the keys, per cached
+                     method, see :func:`cachedecorator`
+
+    :param owner: the object, or class, of the methods, defaults to the
+                  one ``method`` is bound to
+    """
+
+    def __init__(self, method, rules, key_builder, key_args=None,
+                 owner=None):
+        self.method = method
+        self.key_builder = key_builder
+        self.methods = []
+        self.calls = []
+        self._builders = []
+        key_args = key_args or {}
+        if owner is None:
+            owner = getattr(method, "__self__", None)
+        for rule in rules:
+            if not isinstance(rule, dict):
+                self.methods.append(rule)
+            elif "method" not in rule:
+                raise ValueError("%r invalidation rule has no method"
+                                 % (rule,))
+            else:
+                self._check_sources(rule)
+                self.calls.append(rule)
+                self._builders.append(self._builder(
+                    owner, rule["method"], key_args.get(rule["method"])))
+        written = set(key_builder.generation_key(rule["method"])
+                      for rule in self.calls if rule.get("write"))
+        self.writes = bool(written)
+        invalidated = set(key_builder.generation_key(name)
+                          for name in self.methods)
+        #: Generation keys of the written methods, not invalidated
+        self.written_generation_keys = list(written - invalidated)
+
+    def _check_sources(self, rule):
+        """Raise a ValueError if an argument of ``rule`` names no argument
+        of ``method``"""
+        try:
+            parameters = inspect.signature(self.method).parameters
+        except (TypeError, ValueError):  # builtins without a signature
+            return
+        sources = list(rule.get("args", ())) + list(
+            rule.get("kwargs", {}).values())
+        for source in sources:
+            if not callable(source) and source not in parameters:
+                raise ValueError("%r invalidation rule uses %r, which is not "
+                                 "an argument of %s"
+                                 % (rule, source, self.method.__name__))
+
+    def _builder(self, owner, name, key_args):
+        """Return the key builder of the method ``name`` of ``owner``"""
+        target = getattr(owner, name, None)
+        if target is None:
+            return lambda args, kwargs: self.key_builder.build(name, args,
+                                                               kwargs)
+        return self.key_builder.builder(target, key_args)
+
+    def generations(self):
+        """Return a dict of new generations of the invalidated methods"""
+        return dict((self.key_builder.generation_key(name), new_generation())
+                    for name in self.methods)
+
+    def keys(self, args, kwargs):
+        """Return the keys of the results invalidated by a call of
+        ``method``, one per rule of a single call, None for the calls
+        which cannot be cached"""
+        if not self.calls:
+            return []
+        arguments = inspect.getcallargs(self.method, *args, **kwargs)
+
+        def value(source):
+            if callable(source):
+                return source(arguments)
+            return arguments[source]
+
+        keys = []
+        for rule, build_key in zip(self.calls, self._builders):
+            rule_args = tuple(value(source)
+                              for source in rule.get("args", ()))
+            rule_kwargs = dict((name, value(source)) for name, source
+                               in rule.get("kwargs", {}).items())
+            try:
+                keys.append(build_key(rule_args, rule_kwargs))
+            except UncacheableArgument:
+                keys.append(None)
+        return keys
+
+    def entries(self, result, keys, generations):
+        """Return the entries written from the ``result`` of a call of
+        ``method``, in dicts per time to live, and the new generations
+        they need.
+
+        :param keys: the keys of the call, see :meth:`keys`
+
+        :param generations: the current generations of the written
+                            methods, per generation key
+        """
+        generations = dict(generations)
+        new_generations = {}
+        entries = {}
+        for rule, key in zip(self.calls, keys):
+            write = rule.get("write")
+            if not write or key is None:
+                continue
+            generation_key = self.key_builder.generation_key(rule["method"])
+            if generations.get(generation_key) is None:
+                generations[generation_key] = new_generation()
+                new_generations[generation_key] = generations[generation_key]
+            value = write(result) if callable(write) else result
+            entries.setdefault(rule.get("timeout"), {})[key] = (
+                generations[generation_key], value, None)
+        return entries, new_generations
+
+
+def invalidator(method, invalidator_methods, cache, key_builder=None,
+                stats=None, key_args=None, owner=None):
+    """Invalidate the cached results of the methods listed in
+    ``invalidator_methods[method.__name__]`` whenever ``method`` is called.
+
+    Each of those methods gets a new generation, whatever the number of
+    results cached for it. The results of single calls are deleted, or
+    written from the result of ``method``, see :class:`InvalidationRules`.
+
+    The results are invalidated before ``method`` is called, and again
+    once it returns: a result cached meanwhile may predate its changes.
+    """
+    key_builder = key_builder or KeyBuilder()
+    rules = InvalidationRules(method, invalidator_methods[method.__name__],
+                              key_builder, key_args, owner)
+    if stats is not None:
+        cache = InstrumentedCache(cache, stats)
+
+    def write(result, keys, generations):
+        if rules.written_generation_keys:
+            generations = dict(generations)
+            generations.update(
+                cache.get_many(rules.written_generation_keys))
+        entries, new_generations = rules.entries(result, keys, generations)
+        if new_generations:
+            cache.set_many(new_generations, GENERATION_TIMEOUT)
+        for timeout, values in entries.items():
+            cache.set_many(values, timeout)
+
+    def invalidate(deleted):
+        """Renew the generations of the invalidated methods, return them,
+        and delete the ``deleted`` keys"""
+        generations = {}
+        if rules.methods:
+            generations = rules.generations()
+            cache.set_many(generations, GENERATION_TIMEOUT)
+        if deleted:
+            cache.delete_many(deleted)
+        return generations
+
     @wraps(method)
     def wrapper(*args, **kwargs):
-        func_list = cache.get("methods_list")
-        invalidated_methods = invalidator_methods[method.__name__]
-        if func_list:
-            remove_list = []
-            for i in invalidated_methods:
-                remove_list += [f for f in func_list if f.startswith(i)]
-            cache.delete_many(remove_list)
-            func_list = [
-                elem for elem in func_list if elem not in remove_list]
-            cache.set("methods_list", func_list)
+        keys = rules.keys(args, kwargs)
+        deleted = [key for key in keys if key is not None]
+        if stats is not None:
+            stats.invalidations += 1
+            stats.invalidated_methods += len(rules.methods)
+            stats.invalidated_keys += len(deleted)
+        invalidate(deleted)
         result = method(*args, **kwargs)
+        generations = invalidate(deleted)
+        if rules.writes:
+            write(result, keys, generations)
         return result
     return wrapper
@@ -0,0 +1,51 @@
+"""
+Asynchronous interface of an in-memory cache backend.
+
+>>> import asyncio
+>>> from pussycache.cache import BaseCacheBackend
+>>> from pussycache.cache.async_backend import AsyncCacheBackend
+>>> cache = AsyncCacheBackend(BaseCacheBackend(100))
+>>> asyncio.run(cache.set('my_key', 'hello, world!'))
+>>> asyncio.run(cache.get('my_key'))
+'hello, world!'
+>>> asyncio.run(cache.get_many(['my_key', 'other_key']))
+{'my_key': 'hello, world!'}
+>>> asyncio.run(cache.clear())
+"""
+
+
+class AsyncCacheBackend(object):
+    """
+    Expose the methods of a cache backend as coroutines.
+
+    The wrapped backend is called directly from the event loop, so it
+    must not block: use it for in-memory backends only.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.timeout = backend.timeout
+
+    async def clear(self):
+        self.backend.clear()
+
+    async def set(self, key, value, timeout=None):
+        self.backend.set(key, value, timeout)
+
+    async def get(self, key, default_value=None):
+        return self.backend.get(key, default_value)
+
+    async def delete(self, key):
+        self.backend.delete(key)
+
+    async def add(self, key, value, timeout=None):
+        return self.backend.add(key, value, timeout)
+
+    async def set_many(self, valuesdict, timeout=None):
+        self.backend.set_many(valuesdict, timeout)
+
+    async def get_many(self, keys, timeout=None):
+        return self.backend.get_many(keys)
+
+    async def delete_many(self, keys):
+        self.backend.delete_many(keys)
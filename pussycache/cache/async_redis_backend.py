@@ -0,0 +1,171 @@
+"""
+Asynchronous redis cache backend.
+
+>>> import asyncio
+>>> from pussycache.cache.async_redis_backend import AsyncRedisCacheBackend
+>>> async def example():
+...     cache = AsyncRedisCacheBackend(100)
+...     await cache.set('my_key', 'hello, world!', 1)
+...     print(await cache.get('my_key'))
+...     print(await cache.add('my_key', 'New value'))
+...     await cache.set_many({'short': 1}, 0.5)
+...     print(0 < await cache.db.pttl('short') <= 500)
+...     await cache.set_many({'a': 1, 'b': 2})
+...     print(sorted((await cache.get_many(['a', 'b', 'c'])).items()))
+...     await cache.delete_many(['a', 'b'])
+...     print(await cache.get('a', 'deleted'))
+...     users = AsyncRedisCacheBackend(100, prefix='users:')
+...     await users.set('a', 1)
+...     await cache.set('b', 2)
+...     await users.clear()
+...     print(await users.get('a'), await cache.get('b'))
+...     chunked = AsyncRedisCacheBackend(100, chunk_size=1000)
+...     await chunked.set_many({'big': b'x' * 2500})
+...     print((await chunked.get_many(['big']))['big'] == b'x' * 2500)
+...     await cache.clear()
+>>> asyncio.run(example())
+hello, world!
+False
+True
+[('a', 1), ('b', 2)]
+deleted
+None 2
+True
+"""
+try:
+    import redis.asyncio
+except ImportError:
+    raise ImportError("You need to get a running instance of redis-server \
+and the python redis connector (eg: pip install redis) to use this backend")
+
+from pussycache.cache.redis_backend import \
+    CLEAR_BATCH, chunk_keys, is_chunked, milliseconds, prefix_pattern, \
+    prefixed, split_chunks
+from pussycache.serializers import Codec
+
+
+class AsyncRedisCacheBackend(object):
+    """
+    Redis cache implementation for asyncio, storing the values like
+    :class:`pussycache.cache.redis_backend.RedisCacheBackend` does.
+
+    :param prefix: prefix of the keys, ``clear`` only removes the keys
+                   starting with it
+
+    :param chunk_size: values bigger than this, in bytes once encoded, are
+                       written in chunks of this size
+    """
+    def __init__(self, timeout, host='localhost', port=6379, db=0,
+                 serializer=None, compress_threshold=None, compressor=None,
+                 prefix=None, chunk_size=None):
+        self.db = redis.asyncio.Redis(host=host, port=port, db=db)
+        self.timeout = timeout
+        self.prefix = prefix
+        self.chunk_size = chunk_size
+        self.codec = Codec(serializer, compress_threshold, compressor)
+
+    def _encode(self, key, value):
+        data = self.codec.dumps(value)
+        if self.chunk_size is None or len(data) <= self.chunk_size:
+            return {key: data}
+        return split_chunks(key, data, self.chunk_size)
+
+    async def _write(self, values, timeout):
+        async with self.db.pipeline(transaction=False) as pipeline:
+            for key, data in values.items():
+                pipeline.set(key, data,
+                             px=milliseconds(timeout or self.timeout))
+            await pipeline.execute()
+
+    async def _join(self, keys, values):
+        """Replace the manifests of the chunked ``values`` of ``keys`` by
+        their data, or None if a chunk expired"""
+        chunked = [(i, chunk_keys(keys[i], data))
+                   for i, data in enumerate(values) if is_chunked(data)]
+        if not chunked:
+            return values
+        values = list(values)
+        chunks = iter(await self.db.mget([name for i, names in chunked
+                                          for name in names]))
+        for i, names in chunked:
+            data = [next(chunks) for name in names]
+            values[i] = None if None in data else b"".join(data)
+        return values
+
+    def _load(self, data, default_value=None):
+        if data is None:
+            return default_value
+        return self.codec.loads(data)
+
+    def _key(self, key):
+        if self.prefix:
+            return prefixed(self.prefix, key)
+        return key
+
+    async def clear(self):
+        """Clear all the cache: the keys starting with the prefix if any,
+        the whole database otherwise"""
+        if not self.prefix:
+            await self.db.flushdb()
+            return
+        batch = []
+        async for key in self.db.scan_iter(match=prefix_pattern(self.prefix),
+                                           count=CLEAR_BATCH):
+            batch.append(key)
+            if len(batch) >= CLEAR_BATCH:
+                await self.db.unlink(*batch)
+                batch = []
+        if batch:
+            await self.db.unlink(*batch)
+
+    async def set(self, key, value, timeout=None):
+        key = self._key(key)
+        await self._write(self._encode(key, value), timeout)
+
+    async def get(self, key, default_value=None):
+        key = self._key(key)
+        data = await self.db.get(key)
+        if is_chunked(data):
+            data = (await self._join([key], [data]))[0]
+        return self._load(data, default_value)
+
+    async def delete(self, key):
+        """Remove a key/value from the store """
+        await self.db.delete(self._key(key))
+
+    async def add(self, key, value, timeout=None):
+        """Add a key/value to the store unless this key already exists,
+        return whether it has been added"""
+        key = self._key(key)
+        values = self._encode(key, value)
+        data = values.pop(key)
+        if values:
+            await self._write(values, timeout)  # the chunks
+        return bool(await self.db.set(
+            key, data, nx=True, px=milliseconds(timeout or self.timeout)))
+
+    async def set_many(self, valuesdict, timeout=None):
+        values = {}
+        for k, v in valuesdict.items():
+            values.update(self._encode(self._key(k), v))
+        await self._write(values, timeout)
+
+    async def get_many(self, keys, timeout=None):
+        """Return a dict of the values of the given keys, the keys which do
+        not exist are left out"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        redis_keys = [self._key(key) for key in keys]
+        values = await self._join(redis_keys,
+                                  await self.db.mget(redis_keys))
+        return dict((key, self._load(data))
+                    for key, data in zip(keys, values)
+                    if data is not None)
+
+    async def delete_many(self, keys):
+        if keys:
+            await self.db.delete(*[self._key(key) for key in keys])
+
+    async def close(self):
+        await self.db.aclose()
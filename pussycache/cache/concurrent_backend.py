@@ -0,0 +1,119 @@
+"""
+A thread safe in-memory cache backend.
+
+>>> from pussycache.cache.concurrent_backend import ConcurrentCacheBackend
+>>> cache = ConcurrentCacheBackend(100, shards=4, max_entries=1000)
+>>> cache.set('my_key', 'hello, world!')
+>>> cache.get('my_key')
+'hello, world!'
+>>> cache.add('my_key', 'New value')
+False
+>>> cache.set_many({'a': 1, 'b': 2, 'c': 3})
+>>> sorted(cache.get_many(['a', 'b', 'c', 'd']).items())
+[('a', 1), ('b', 2), ('c', 3)]
+>>> cache.delete_many(['a', 'b', 'c'])
+>>> len(cache)
+1
+>>> cache.clear()
+>>> cache.get('my_key')
+
+"""
+from pussycache.cache import BaseCacheBackend, _Sweeper
+
+
+class ConcurrentCacheBackend(BaseCacheBackend):
+    """
+    Split the keys among ``shards`` thread safe
+    :class:`pussycache.cache.BaseCacheBackend`, each one guarded by its
+    own lock, so that threads using different keys seldom wait for each
+    other.
+
+    ``max_entries`` and ``max_size`` are split evenly among the shards,
+    the other parameters are the ones of
+    :class:`pussycache.cache.BaseCacheBackend`.
+    """
+
+    def __init__(self, timeout, shards=16, max_entries=None, max_size=None,
+                 sweep_interval=None, **kwargs):
+        self.timeout = timeout
+        self.shards = [
+            BaseCacheBackend(timeout,
+                             max_entries=_split(max_entries, shards),
+                             max_size=_split(max_size, shards),
+                             thread_safe=True, **kwargs)
+            for i in range(shards)]
+        self._sweeper = None
+        if sweep_interval:
+            self._sweeper = _Sweeper(self, sweep_interval)
+            self._sweeper.start()
+
+    def _shard(self, key):
+        return self.shards[hash(key) % len(self.shards)]
+
+    def _group(self, keys):
+        """Return a dict of the given keys per shard"""
+        groups = {}
+        for key in keys:
+            groups.setdefault(self._shard(key), []).append(key)
+        return groups
+
+    def __len__(self):
+        return sum(len(shard.store) for shard in self.shards)
+
+    @property
+    def size(self):
+        return sum(shard.size for shard in self.shards)
+
+    @property
+    def evictions(self):
+        return sum(shard.evictions for shard in self.shards)
+
+    @property
+    def expirations(self):
+        return sum(shard.expirations for shard in self.shards)
+
+    def clear(self):
+        """Clear all the cache"""
+        for shard in self.shards:
+            shard.clear()
+
+    def set(self, key, value, timeout=None):
+        self._shard(key).set(key, value, timeout)
+
+    def get(self, key, default_value=None):
+        return self._shard(key).get(key, default_value)
+
+    def delete(self, key):
+        """Remove a key/value from the store """
+        self._shard(key).delete(key)
+
+    def add(self, key, value, timeout=None):
+        """Add a key/value to the store unless this key already exists,
+        return whether it has been added"""
+        return self._shard(key).add(key, value, timeout)
+
+    def set_many(self, valuesdict, timeout=None):
+        for shard, keys in self._group(valuesdict).items():
+            shard.set_many(dict((key, valuesdict[key]) for key in keys),
+                           timeout)
+
+    def get_many(self, keys, timeout=None):
+        response = {}
+        for shard, keys in self._group(keys).items():
+            response.update(shard.get_many(keys))
+        return response
+
+    def delete_many(self, keys):
+        for shard, keys in self._group(keys).items():
+            shard.delete_many(keys)
+
+    def purge_expired(self):
+        """Remove all the expired entries from the store, return how many
+        were removed"""
+        return sum(shard.purge_expired() for shard in self.shards)
+
+
+def _split(limit, shards):
+    if limit:
+        return max(limit // shards, 1)
+    return limit
@@ -1,6 +1,6 @@
 """
-A test implementation of Django Cache framework.
-from pussycache.cache.django_backend import DjangoCacheBackend
+A cache backend using the Django cache framework.
+>>> from pussycache.cache.django_backend import DjangoCacheBackend
 >>> cache = DjangoCacheBackend(100,
 ...    'django.core.cache.backends.locmem.LocMemCache',
 ...    'cache-proof-of-concept')
@@ -40,7 +40,8 @@ False
 
 from pussycache.cache import BaseCacheBackend
 try:
-    from django.conf import settings
+    from django.core.cache import caches
+    from django.utils.module_loading import import_string
 except ImportError:
     raise ImportError("You need to install django \
 (eg: pip install django) to use this backend")
@@ -48,19 +49,80 @@ except ImportError:
 
 class DjangoCacheBackend(BaseCacheBackend):
     """
-    django cache backend proxy make it possible to use django cache
-    backend without Django.
+    Store the values in a Django cache.
+
+    In a Django project, it uses one of the configured ``CACHES``, sharing
+    its client and connections with the project::
+
+        cache = DjangoCacheBackend(alias="default")
+
+    Without Django settings, it builds a Django cache from its backend
+    path and location, eg: ``DjangoCacheBackend(100,
+    'django.core.cache.backends.locmem.LocMemCache', 'pussycache')``. The
+    other keyword arguments are the ones of a ``CACHES`` entry, like
+    ``OPTIONS`` or ``KEY_PREFIX``.
+
+    ``get_many``, ``set_many``, ``delete_many`` and ``add`` are the ones of
+    the Django cache, which does them in one round trip when its backend
+    can.
+
+    Like the other backends, it caches ``None`` values: pass a sentinel
+    such as :data:`pussycache.cache.MISSING` as default value to ``get``
+    to tell them from a miss.
+
+    :param timeout: default time to live of the values, defaults to the
+                    one of the Django cache
+
+    :param alias: name of the Django cache in the ``CACHES`` setting
+
+    :param cache: a Django cache to use, instead of ``alias``
     """
-    def __new__(cls, timeout, backend, location, *args, **kwargs):
-        caches = {
-            "default": {
-                "BACKEND": backend,
-                "LOCATION": location,
-                "TIMEOUT": timeout
-                }
-            }
-        caches["default"].update(kwargs)
-        settings.configure(CACHES=caches)
-        import django.core.cache
-        obj = django.core.cache.get_cache('default')
-        return obj
+
+    def __init__(self, timeout=None, backend=None, location=None,
+                 alias="default", cache=None, **params):
+        if backend is not None:
+            params["TIMEOUT"] = timeout
+            cache = import_string(backend)(location, params)
+        self.alias = alias
+        self._cache = cache
+        self.timeout = timeout or self.cache.default_timeout
+
+    @property
+    def cache(self):
+        """The Django cache, the one of the current thread for an alias"""
+        if self._cache is not None:
+            return self._cache
+        return caches[self.alias]
+
+    def clear(self):
+        """Clear all the cache"""
+        self.cache.clear()
+
+    def set(self, key, value, timeout=None):
+        """Add a key/value to the store """
+        self.cache.set(key, value, timeout or self.timeout)
+
+    def get(self, key, default_value=None):
+        """return the value corresponding to the key or
+        ``default_value`` if expired or does not exist """
+        return self.cache.get(key, default_value)
+
+    def delete(self, key):
+        """Remove a key/value from the store """
+        self.cache.delete(key)
+
+    def add(self, key, value, timeout=None):
+        """Add a key/value to the store unless this key already exists,
+        return whether it has been added"""
+        return self.cache.add(key, value, timeout or self.timeout)
+
+    def set_many(self, valuesdict, timeout=None):
+        self.cache.set_many(valuesdict, timeout or self.timeout)
+
+    def get_many(self, keys, timeout=None):
+        """Return a dict of the values of the given keys, the keys expired
+        or which do not exist are left out"""
+        return self.cache.get_many(keys)
+
+    def delete_many(self, keys):
+        self.cache.delete_many(keys)
@@ -0,0 +1,213 @@
+"""
+A two tiers cache: a bounded in-process cache in front of redis.
+
+>>> from pussycache.cache.redis_backend import RedisCacheBackend
+>>> from pussycache.cache.layered_backend import LayeredCacheBackend
+>>> cache = LayeredCacheBackend(RedisCacheBackend(100), local_timeout=5)
+>>> cache.set('my_key', 'hello, world!')
+>>> cache.get('my_key')
+'hello, world!'
+>>> cache.local.get('my_key')
+'hello, world!'
+>>> cache.local.clear()
+>>> cache.get('my_key')
+'hello, world!'
+>>> cache.local.get('my_key')
+'hello, world!'
+>>> cache.delete('my_key')
+>>> cache.get('my_key')
+
+>>> cache.set_many({'a': 1, 'b': 2, 'c': 3})
+>>> cache.local.delete('a')
+>>> sorted(cache.get_many(['a', 'b', 'c', 'd']).items())
+[('a', 1), ('b', 2), ('c', 3)]
+>>> cache.clear()
+>>> cache.close()
+"""
+import pickle
+import threading
+import uuid
+
+from pussycache.cache import BaseCacheBackend, MISSING
+from pussycache.cache.concurrent_backend import ConcurrentCacheBackend
+
+#: Default time to live of the local values, in seconds
+LOCAL_TIMEOUT = 5
+
+
+class LayeredCacheBackend(BaseCacheBackend):
+    """
+    Keep the values read from or written to a remote cache backend in a
+    local in-memory cache backend.
+
+    The keys written or deleted by a :class:`LayeredCacheBackend` are
+    published on a redis channel, so that the other ones sharing the same
+    remote backend drop them from their local cache. Local values are
+    kept ``local_timeout`` seconds at most, which bounds their staleness
+    if a message is lost, and no longer than they live in the remote
+    cache. A value read while its key gets invalidated is not kept.
+
+    :param remote: the shared cache backend, usually a
+                   :class:`pussycache.cache.redis_backend.RedisCacheBackend`
+
+    :param local: the in-process cache backend, defaults to a
+                  :class:`pussycache.cache.concurrent_backend.\
+ConcurrentCacheBackend` of ``max_entries`` entries
+
+    :param local_timeout: time to live of the local values, in seconds
+
+    :param channel: the redis channel of invalidations, or None to not
+                    publish nor listen to them
+    """
+    def __init__(self, remote, local=None, local_timeout=LOCAL_TIMEOUT,
+                 max_entries=10000, channel="pussycache:invalidations"):
+        self.remote = remote
+        self.timeout = remote.timeout
+        self.local_timeout = min(local_timeout, remote.timeout)
+        if local is None:
+            local = ConcurrentCacheBackend(self.local_timeout,
+                                           max_entries=max_entries)
+        self.local = local
+        self.channel = channel
+        self.id = uuid.uuid4().hex
+        # key: [invalidations, readers] of the keys being read, the values
+        # invalidated while they were read are not kept locally
+        self._reading = {}
+        self._lock = threading.Lock()
+        self._listener = None
+        if channel:
+            pubsub = remote.db.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{channel: self._on_invalidation})
+            self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def __getattr__(self, name):
+        # Locks, pipelines... are the remote ones
+        if name == "remote":
+            raise AttributeError(name)
+        return getattr(self.remote, name)
+
+    def close(self):
+        """Stop listening to the invalidations"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def _publish(self, keys):
+        """Tell the other layered caches to drop ``keys`` from their local
+        cache, or all the keys if None. Called once the remote cache is
+        written, before the local one."""
+        with self._lock:
+            self._invalidate(keys)
+        if self.channel:
+            # Through the current pipeline if any, after the writes
+            self.remote._writer.publish(self.channel,
+                                        pickle.dumps((self.id, keys)))
+
+    def _on_invalidation(self, message):
+        sender, keys = pickle.loads(message["data"])
+        if sender == self.id:
+            return
+        with self._lock:
+            self._invalidate(keys)
+            if keys is None:
+                self.local.clear()
+            else:
+                self.local.delete_many(keys)
+
+    def _invalidate(self, keys):
+        """Tell the reads in progress of ``keys``, or of all the keys if
+        None, to not keep their value"""
+        if keys is None:
+            keys = list(self._reading)
+        for key in keys:
+            reading = self._reading.get(key)
+            if reading is not None:
+                reading[0] += 1
+
+    def _read(self, keys):
+        """Return a dict of the remote values of ``keys``, and keep them
+        locally until they expire, ``local_timeout`` seconds at most"""
+        versions = {}
+        with self._lock:
+            for key in keys:
+                reading = self._reading.setdefault(key, [0, 0])
+                reading[1] += 1
+                versions[key] = reading[0]
+        found = {}
+        try:
+            get_many_with_ttl = getattr(self.remote, "get_many_with_ttl",
+                                        None)
+            if get_many_with_ttl is None:
+                found = dict((key, (value, None)) for key, value
+                             in self.remote.get_many(keys).items())
+            else:
+                found = get_many_with_ttl(keys)
+        finally:
+            with self._lock:
+                per_timeout = {}
+                for key in keys:
+                    reading = self._reading[key]
+                    if key in found and reading[0] == versions[key]:
+                        value, ttl = found[key]
+                        if ttl is None or ttl > 0:
+                            per_timeout.setdefault(
+                                self._local_timeout(ttl), {})[key] = value
+                    reading[1] -= 1
+                    if not reading[1]:
+                        del self._reading[key]
+                for timeout, values in per_timeout.items():
+                    self.local.set_many(values, timeout)
+        return dict((key, value) for key, (value, ttl) in found.items())
+
+    def _local_timeout(self, timeout):
+        return min(timeout or self.timeout, self.local_timeout)
+
+    def clear(self):
+        self.remote.clear()
+        self._publish(None)
+        self.local.clear()
+
+    def set(self, key, value, timeout=None):
+        self.remote.set(key, value, timeout)
+        self._publish([key])
+        self.local.set(key, value, self._local_timeout(timeout))
+
+    def get(self, key, default_value=None):
+        value = self.local.get(key, MISSING)
+        if value is MISSING:
+            return self._read([key]).get(key, default_value)
+        return value
+
+    def delete(self, key):
+        """Remove a key/value from the store """
+        self.remote.delete(key)
+        self._publish([key])
+        self.local.delete(key)
+
+    def add(self, key, value, timeout=None):
+        """Add a key/value to the store unless this key already exists """
+        added = self.remote.add(key, value, timeout)
+        if added:
+            self._publish([key])
+            self.local.set(key, value, self._local_timeout(timeout))
+        return added
+
+    def set_many(self, valuesdict, timeout=None):
+        self.remote.set_many(valuesdict, timeout)
+        self._publish(list(valuesdict))
+        self.local.set_many(valuesdict, self._local_timeout(timeout))
+
+    def get_many(self, keys, timeout=None):
+        keys = list(keys)
+        response = self.local.get_many(keys)
+        missing = [key for key in keys if key not in response]
+        if missing:
+            response.update(self._read(missing))
+        return response
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        if keys:
+            self.remote.delete_many(keys)
+            self._publish(keys)
+            self.local.delete_many(keys)
@@ -14,9 +14,11 @@ Implement a base CacheBackend API.
 'has expired'
 >>> cache.set('add_key', 'Initial value')
 >>> cache.add('add_key', 'New value')
+False
 >>> cache.get('add_key')
 'Initial value'
 >>> cache.add('anotherkey', 'my key')
+True
 >>> cache.get('anotherkey')
 'my key'
 >>> cache.delete('add_key')
@@ -36,8 +38,71 @@ Implement a base CacheBackend API.
 >>> cache.delete_many(['a', 'b', 'c'])
 >>> cache.get('a')
 
+>>> cache.set('a', 1, 10)
+>>> value, ttl = cache.get_many_with_ttl(['a', 'b'])['a']
+>>> value, 9 < ttl <= 10
+(1, True)
+
+The times to live may be fractions of a second:
+
+>>> cache.set('short', 1, 0.5)
+>>> cache.add('shorter', 1, 0.25)
+True
+>>> 0 < cache.db.pttl('short') <= 500, 0 < cache.db.pttl('shorter') <= 250
+(True, True)
+>>> cache.set('raw', b'stored as is')
+>>> cache.db.get('raw')
+b'rstored as is'
+>>> from pussycache.cache import MISSING
+>>> cache.set('nothing', None)
+>>> cache.get('nothing', MISSING)
+
+>>> cache.get('unknown', MISSING)
+MISSING
+>>> cache.get_many(['nothing', 'unknown'])
+{'nothing': None}
+>>> with cache.pipeline():
+...     cache.set('a', 1)
+...     cache.delete('b')
+>>> cache.get('a')
+1
+
+``add`` is sent right away, even in a ``pipeline()`` block, so that the
+first result of a cached method is cached there too:
+
+>>> from pussycache.cache import cachedecorator
+>>> calls = []
+>>> def get_user(name):
+...     calls.append(name)
+...     return name.title()
+>>> cached = cachedecorator(get_user, cache)
+>>> with cache.pipeline():
+...     cached('bob')
+'Bob'
+>>> cached('bob'), calls
+('Bob', ['bob'])
 >>> cache.clear()
 
+With a prefix, ``clear`` only removes the keys of the cache:
+
+>>> users = RedisCacheBackend(100, prefix='users:')
+>>> users.set('a', 1)
+>>> cache.set('a', 2)
+>>> users.db.exists('users:a')
+1
+>>> users.clear()
+>>> users.get('a'), cache.get('a')
+(None, 2)
+
+With a ``chunk_size``, the big values are written in chunks:
+
+>>> cache = RedisCacheBackend(100, chunk_size=1000)
+>>> cache.set('big', b'x' * 2500)
+>>> cache.db.get('big')[:1]
+b'c'
+>>> cache.get('big') == b'x' * 2500
+True
+>>> cache.clear()
 """
 try:
     import redis
@@ -45,52 +110,296 @@ except ImportError:
     raise ImportError("You need to get a running instance of redis-server \
 and the python redis connector (eg: pip install redis) to use this backend")
 
-import pickle
-pickle.DEFAULT_PROTOCOL = 2
+import math
+import re
+import struct
+import threading
+import uuid
+from contextlib import contextmanager
+
 from pussycache.cache import BaseCacheBackend
+from pussycache.serializers import CHUNKED, Codec
+
+# Number of keys scanned, and unlinked, at once by ``clear``
+CLEAR_BATCH = 1000
+
+
+def prefixed(prefix, key):
+    """Return ``key`` in the namespace ``prefix``"""
+    if isinstance(key, bytes):
+        return prefix.encode("utf-8") + key
+    return prefix + key
+
+
+def milliseconds(seconds):
+    """Return a time to live in whole milliseconds, redis rejects the
+    fractional ones
+
+    >>> milliseconds(0.5), milliseconds(30), milliseconds(0.0001)
+    (500, 30000, 1)
+    """
+    return int(math.ceil(seconds * 1000))
+
+
+def prefix_pattern(prefix):
+    """Return the ``SCAN`` pattern of the keys starting with ``prefix``"""
+    return re.sub(r"([*?\[\]\\])", r"\\\1", prefix) + "*"
+
+
+# Number of chunks of a value
+CHUNKS = struct.Struct("<I")
+
+
+def split_chunks(key, data, chunk_size):
+    """Return a dict of the redis values of ``data`` split in chunks of
+    ``chunk_size`` bytes, memory views of it, and of its manifest stored
+    at ``key``, written last"""
+    view = memoryview(data)
+    count = (len(view) + chunk_size - 1) // chunk_size
+    # Unique per write, so that the chunks of a previous value are not
+    # read along with a newer manifest
+    manifest = CHUNKED + CHUNKS.pack(count) + uuid.uuid4().hex.encode()
+    values = dict(zip(chunk_keys(key, manifest),
+                      (view[start:start + chunk_size]
+                       for start in range(0, len(view), chunk_size))))
+    values[key] = manifest
+    return values
+
+
+def chunk_keys(key, manifest):
+    """Return the keys of the chunks of the value stored at ``key``"""
+    count = CHUNKS.unpack_from(manifest, 1)[0]
+    if not isinstance(key, bytes):
+        key = key.encode("utf-8")
+    key += b":chunk:" + manifest[1 + CHUNKS.size:] + b":"
+    return [key + str(i).encode() for i in range(count)]
+
+
+def is_chunked(data):
+    return data is not None and data[:1] == CHUNKED
 
 
 class RedisCacheBackend(BaseCacheBackend):
     """
     Redis cache implementation
+
+    Every operation is a single round trip to redis, values are written
+    along with their time to live, in milliseconds (``SET PX``).
+
+    :param serializer: serializes the values which are neither bytes nor
+                       text, a :mod:`pussycache.serializers` serializer,
+                       defaults to pickle
+
+    :param compress_threshold: values bigger than this, in bytes once
+                               serialized, are compressed
+
+    :param compressor: compresses the values, a module or object with
+                       ``compress`` and ``decompress`` functions,
+                       defaults to :mod:`zlib`
+
+    :param connection_pool: the redis connection pool to use, instead of
+                            ``host``, ``port`` and ``db``
+
+    :param prefix: prefix of the keys, so that several caches, or other
+                   applications, share the database: ``clear`` only
+                   removes the keys starting with it, incrementally with
+                   ``SCAN`` and ``UNLINK``. Without it, ``clear`` flushes
+                   the database.
+
+    :param chunk_size: values bigger than this, in bytes once encoded, are
+                       written in chunks of this size, so that a big value
+                       does not hold redis, and read back with one more
+                       ``MGET``. None to never split the values. The
+                       chunks of a value deleted or replaced expire with
+                       it.
+
+    The writes done within a ``pipeline()`` block are sent all together
+    when it exits, but for ``add`` whose result is needed right away.
     """
-    def __init__(self, timeout, host='localhost', port=6379, db=0):
-        self.db = redis.StrictRedis(host=host, port=port, db=db)
+    def __init__(self, timeout, host='localhost', port=6379, db=0,
+                 serializer=None, compress_threshold=None, compressor=None,
+                 connection_pool=None, prefix=None, chunk_size=None):
+        self.db = redis.StrictRedis(host=host, port=port, db=db,
+                                    connection_pool=connection_pool)
         self.timeout = timeout
+        self.prefix = prefix
+        self.chunk_size = chunk_size
+        self.codec = Codec(serializer, compress_threshold, compressor)
+        self._local = threading.local()
+
+    @contextmanager
+    def pipeline(self):
+        """Group the writes done by the current thread in the block into
+        one round trip.
+
+        Reads are not delayed: they are still sent right away.
+        """
+        if getattr(self._local, "pipeline", None) is not None:
+            yield self  # nested block, the outer one executes
+            return
+        self._local.pipeline = self.db.pipeline(transaction=False)
+        try:
+            yield self
+        finally:
+            pipeline, self._local.pipeline = self._local.pipeline, None
+            pipeline.execute()
+
+    @property
+    def _writer(self):
+        """The current pipeline if any, the redis connection otherwise"""
+        return getattr(self._local, "pipeline", None) or self.db
+
+    def _encode(self, key, value):
+        """Return a dict of the redis values storing ``value`` at ``key``:
+        the encoded value, or its chunks and their manifest"""
+        data = self.codec.dumps(value)
+        if self.chunk_size is None or len(data) <= self.chunk_size:
+            return {key: data}
+        return split_chunks(key, data, self.chunk_size)
+
+    def _write(self, values, timeout):
+        if len(values) > 1 and self._writer is self.db:
+            with self.pipeline():
+                return self._write(values, timeout)
+        for key, data in values.items():
+            self._writer.set(key, data,
+                             px=milliseconds(timeout or self.timeout))
+
+    def _join(self, keys, values):
+        """Replace the manifests of the chunked ``values`` of ``keys`` by
+        their data, read with one ``MGET``, or None if a chunk expired"""
+        chunked = [(i, chunk_keys(keys[i], data))
+                   for i, data in enumerate(values) if is_chunked(data)]
+        if not chunked:
+            return values
+        values = list(values)
+        chunks = iter(self.db.mget([name for i, names in chunked
+                                    for name in names]))
+        for i, names in chunked:
+            data = [next(chunks) for name in names]
+            values[i] = None if None in data else b"".join(data)
+        return values
+
+    def _load(self, data, default_value=None):
+        if data is None:
+            return default_value
+        return self.codec.loads(data)
+
+    def _key(self, key):
+        if self.prefix:
+            return prefixed(self.prefix, key)
+        return key
 
     def clear(self):
-        self.db.flushdb()
+        """Clear all the cache: the keys starting with the prefix if any,
+        the whole database otherwise"""
+        if not self.prefix:
+            self._writer.flushdb()
+            return
+        batch = []
+        for key in self.db.scan_iter(match=prefix_pattern(self.prefix),
+                                     count=CLEAR_BATCH):
+            batch.append(key)
+            if len(batch) >= CLEAR_BATCH:
+                self._writer.unlink(*batch)
+                batch = []
+        if batch:
+            self._writer.unlink(*batch)
 
     def set(self, key, value, timeout=None):
-        self.db.set(key, pickle.dumps({"value": value}))
-        self.db.expire(key, timeout or self.timeout)
+        key = self._key(key)
+        self._write(self._encode(key, value), timeout)
 
     def get(self, key, default_value=None):
-        try:
-            value = pickle.loads(self.db.get(key))
-        except TypeError:
-            return default_value or None
-        return value["value"]
+        key = self._key(key)
+        data = self.db.get(key)
+        if is_chunked(data):
+            data = self._join([key], [data])[0]
+        return self._load(data, default_value)
 
     def delete(self, key):
         """Remove a key/value from the store """
-        self.db.delete(key)
+        self._writer.delete(self._key(key))
 
     def add(self, key, value, timeout=None):
-        """Add a key/value to the store unless this key already exists """
-        if not self.get(key):
-            self.set(key, value, timeout=timeout)
+        """Add a key/value to the store unless this key already exists,
+        return whether it has been added.
+
+        Like the reads, it is sent right away within a ``pipeline()``
+        block, since what is written next often depends on its result."""
+        key = self._key(key)
+        values = self._encode(key, value)
+        data = values.pop(key)
+        ttl = milliseconds(timeout or self.timeout)
+        if values:  # the chunks, written first
+            pipeline = self.db.pipeline(transaction=False)
+            for chunk_key, chunk in values.items():
+                pipeline.set(chunk_key, chunk, px=ttl)
+            pipeline.execute()
+        return bool(self.db.set(key, data, nx=True, px=ttl))
 
     def set_many(self, valuesdict, timeout=None):
-        for k, v in valuesdict.items():
-            self.set(k, v, timeout=timeout)
+        with self.pipeline():
+            for k, v in valuesdict.items():
+                self.set(k, v, timeout=timeout)
 
     def get_many(self, keys, timeout=None):
-        response = {}
-        for elem in keys:
-            response[elem] = self.get(elem)
-        return response
+        """Return a dict of the values of the given keys, the keys which do
+        not exist are left out"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        redis_keys = [self._key(key) for key in keys]
+        values = self._join(redis_keys, self.db.mget(redis_keys))
+        return dict((key, self._load(data))
+                    for key, data in zip(keys, values)
+                    if data is not None)
+
+    def get_many_with_ttl(self, keys):
+        """Return a dict of the values of the given keys along with their
+        remaining time to live in seconds, None if they do not expire, in
+        one round trip"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        redis_keys = [self._key(key) for key in keys]
+        pipeline = self.db.pipeline(transaction=False)
+        pipeline.mget(redis_keys)
+        for key in redis_keys:
+            pipeline.pttl(key)
+        replies = pipeline.execute()
+        values = self._join(redis_keys, replies[0])
+        return dict((key, (self._load(data),
+                           ttl / 1000.0 if ttl >= 0 else None))
+                    for key, data, ttl in zip(keys, values, replies[1:])
+                    if data is not None)
 
     def delete_many(self, keys):
         if keys:
-            self.db.delete(*keys)
+            self._writer.delete(*[self._key(key) for key in keys])
+
+    def lock(self, key, timeout, blocking_timeout=None):
+        """Return a lock on ``key`` shared by all the processes using this
+        redis database.
+
+        It is released after ``timeout`` seconds at most, ``acquire``
+        gives up after ``blocking_timeout`` seconds."""
+        return RedisLock(self.db.lock(self._key("pussycache:lock:%s" % key),
+                                      timeout=timeout,
+                                      blocking_timeout=blocking_timeout))
+
+
+class RedisLock(object):
+    """A redis lock which may have expired when it is released"""
+
+    def __init__(self, lock):
+        self._lock = lock
+
+    def acquire(self):
+        return self._lock.acquire()
+
+    def release(self):
+        try:
+            self._lock.release()
+        except redis.exceptions.LockError:
+            pass  # the lock timed out, someone else may own it now
@@ -0,0 +1,279 @@
+"""
+A cache backend spreading the keys over several redis servers.
+
+>>> from pussycache.cache.sharded_redis_backend import \\
+...     ShardedRedisCacheBackend
+>>> cache = ShardedRedisCacheBackend(100, ['redis://localhost:6379/1',
+...                                        'redis://localhost:6379/2'])
+>>> cache.set('my_key', 'hello, world!')
+>>> cache.get('my_key')
+'hello, world!'
+>>> cache.add('my_key', 'New value')
+False
+>>> cache.set_many({'a': 1, 'b': 2, 'c': 3})
+>>> sorted(cache.get_many(['a', 'b', 'c', 'd']).items())
+[('a', 1), ('b', 2), ('c', 3)]
+>>> cache.delete_many(['a', 'b', 'c'])
+>>> cache.get('a')
+
+>>> cache.clear()
+>>> cache.close()
+"""
+import hashlib
+import struct
+import threading
+from bisect import bisect
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from pussycache.cache import BaseCacheBackend
+from pussycache.cache.redis_backend import RedisCacheBackend, redis
+
+
+def _hash(value):
+    if not isinstance(value, bytes):
+        value = str(value).encode("utf-8")
+    return struct.unpack_from("<Q", hashlib.md5(value).digest())[0]
+
+
+class HashRing(object):
+    """Consistent hashing of keys over nodes.
+
+    Each node is placed ``replicas`` times on the ring, a key belongs to
+    the first node following its hash. Adding or removing a node only
+    moves the keys of its part of the ring.
+
+    >>> ring = HashRing(["a", "b", "c"])
+    >>> ring.node("my_key") in ("a", "b", "c")
+    True
+    >>> before = dict((key, ring.node(key)) for key in range(1000))
+    >>> ring.add("d")
+    >>> moved = [key for key in before if ring.node(key) != before[key]]
+    >>> set(ring.node(key) for key in moved)
+    {'d'}
+    """
+
+    def __init__(self, nodes=(), replicas=160):
+        self.replicas = replicas
+        self.nodes = []
+        self._points = []
+        self._owners = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        self.nodes.append(node)
+        self._build()
+
+    def remove(self, node):
+        self.nodes.remove(node)
+        self._build()
+
+    def _build(self):
+        ring = sorted((_hash("%s-%s" % (node, i)), node)
+                      for node in self.nodes for i in range(self.replicas))
+        self._points = [point for point, node in ring]
+        self._owners = [node for point, node in ring]
+
+    def node(self, key):
+        """Return the node of ``key``"""
+        index = bisect(self._points, _hash(key))
+        return self._owners[index % len(self._owners)]
+
+
+@contextmanager
+def _nested(managers):
+    if not managers:
+        yield
+        return
+    with managers[0]:
+        with _nested(managers[1:]):
+            yield
+
+
+class ShardedRedisCacheBackend(BaseCacheBackend):
+    """
+    Spread the keys over several redis servers, with consistent hashing.
+
+    The batch operations send one pipeline per server, in parallel. Each
+    server has a bounded pool of connections: when they are all used,
+    the threads wait for one to be released, ``pool_timeout`` seconds at
+    most.
+
+    The servers, their hash ring and the threads of the batch operations
+    are replaced together when a server is added or removed, so that an
+    operation uses the ones of a single topology.
+
+    :param nodes: the redis URLs of the servers, eg:
+                  ``redis://localhost:6379/0``
+
+    :param replicas: number of points of each server on the hash ring
+
+    :param max_connections: maximum number of connections to each server
+
+    :param pool_timeout: seconds to wait for a free connection
+
+    The other parameters are the ones of
+    :class:`pussycache.cache.redis_backend.RedisCacheBackend`.
+    """
+
+    def __init__(self, timeout, nodes, replicas=160, max_connections=50,
+                 pool_timeout=5, serializer=None, compress_threshold=None,
+                 compressor=None, prefix=None, chunk_size=None):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self._backend_options = {"serializer": serializer,
+                                 "compress_threshold": compress_threshold,
+                                 "compressor": compressor,
+                                 "prefix": prefix,
+                                 "chunk_size": chunk_size}
+        self.replicas = replicas
+        self._local = threading.local()
+        # The servers per URL, their ring and the executor of the batch
+        # operations, never changed but replaced together
+        self._topology = ({}, HashRing(replicas=replicas), None)
+        self._topology_lock = threading.Lock()
+        for node in nodes:
+            self.add_node(node)
+
+    @property
+    def nodes(self):
+        """The servers, per URL"""
+        return self._topology[0]
+
+    @property
+    def ring(self):
+        """The hash ring of the servers"""
+        return self._topology[1]
+
+    def _replace_nodes(self, nodes):
+        """Use the given servers, return the former executor"""
+        ring = HashRing(nodes, self.replicas)
+        executor = None
+        if len(nodes) > 1:
+            executor = ThreadPoolExecutor(len(nodes))
+        former = self._topology[2]
+        self._topology = (nodes, ring, executor)
+        return former
+
+    def add_node(self, url):
+        """Add the redis server at ``url``, only the keys of the part of
+        the ring it takes move to it"""
+        pool = redis.BlockingConnectionPool.from_url(
+            url, max_connections=self.max_connections,
+            timeout=self.pool_timeout)
+        node = RedisCacheBackend(self.timeout, connection_pool=pool,
+                                 **self._backend_options)
+        with self._topology_lock:
+            nodes = dict(self.nodes)
+            nodes[url] = node
+            executor = self._replace_nodes(nodes)
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def remove_node(self, url):
+        """Stop using the redis server at ``url``"""
+        with self._topology_lock:
+            nodes = dict(self.nodes)
+            node = nodes.pop(url)
+            executor = self._replace_nodes(nodes)
+        if executor is not None:
+            executor.shutdown(wait=False)
+        node.db.connection_pool.disconnect()
+
+    def close(self):
+        """Disconnect from all the servers"""
+        nodes, ring, executor = self._topology
+        if executor is not None:
+            executor.shutdown(wait=False)
+        for node in nodes.values():
+            node.db.connection_pool.disconnect()
+
+    def _node(self, key):
+        nodes, ring, executor = self._topology
+        return nodes[ring.node(key)]
+
+    def _group(self, keys):
+        """Return a dict of the given keys per server, and the executor of
+        these servers"""
+        nodes, ring, executor = self._topology
+        groups = {}
+        for key in keys:
+            groups.setdefault(nodes[ring.node(key)], []).append(key)
+        return groups, executor
+
+    def _map(self, func, groups, executor):
+        """Call ``func`` with each server and its keys, in parallel, return
+        the results"""
+        if len(groups) > 1 and executor is not None \
+                and not getattr(self._local, "pipelined", False):
+            try:
+                futures = [executor.submit(func, node, keys)
+                           for node, keys in groups.items()]
+            except RuntimeError:
+                pass  # shut down by a change of the servers meanwhile
+            else:
+                return [future.result() for future in futures]
+        # The pipelines are the ones of the current thread
+        return [func(node, keys) for node, keys in groups.items()]
+
+    @contextmanager
+    def pipeline(self):
+        """Group the writes done by the current thread in the block into
+        one round trip per server"""
+        if getattr(self._local, "pipelined", False):
+            yield self  # nested block, the outer one executes
+            return
+        self._local.pipelined = True
+        try:
+            with _nested([node.pipeline() for node in self.nodes.values()]):
+                yield self
+        finally:
+            self._local.pipelined = False
+
+    def clear(self):
+        """Clear all the cache"""
+        nodes, ring, executor = self._topology
+        self._map(lambda node, keys: node.clear(),
+                  dict((node, None) for node in nodes.values()), executor)
+
+    def set(self, key, value, timeout=None):
+        """Add a key/value to the store """
+        self._node(key).set(key, value, timeout)
+
+    def get(self, key, default_value=None):
+        """return the value corresponding to the key or
+        ``default_value`` if expired or does not exist """
+        return self._node(key).get(key, default_value)
+
+    def delete(self, key):
+        """Remove a key/value from the store """
+        self._node(key).delete(key)
+
+    def add(self, key, value, timeout=None):
+        """Add a key/value to the store unless this key already exists,
+        return whether it has been added"""
+        return self._node(key).add(key, value, timeout)
+
+    def set_many(self, valuesdict, timeout=None):
+        self._map(lambda node, keys: node.set_many(
+            dict((key, valuesdict[key]) for key in keys), timeout),
+            *self._group(valuesdict))
+
+    def get_many(self, keys, timeout=None):
+        """Return a dict of the values of the given keys, the keys which do
+        not exist are left out"""
+        response = {}
+        for values in self._map(lambda node, keys: node.get_many(keys),
+                                *self._group(keys)):
+            response.update(values)
+        return response
+
+    def delete_many(self, keys):
+        self._map(lambda node, keys: node.delete_many(keys),
+                  *self._group(keys))
+
+    def lock(self, key, timeout, blocking_timeout=None):
+        """Return a lock on ``key``, on the server of ``key``"""
+        return self._node(key).lock(key, timeout, blocking_timeout)
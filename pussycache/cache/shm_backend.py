@@ -0,0 +1,287 @@
+"""
+A cache backend shared by the processes of a host, in shared memory.
+
+>>> from pussycache.cache.shm_backend import SharedMemoryCacheBackend
+>>> cache = SharedMemoryCacheBackend(100, name='doctest', slots=256)
+>>> cache.set('my_key', 'hello, world!', 1)
+>>> cache.get('my_key')
+'hello, world!'
+
+Every process opening the same ``name`` sees the same values:
+
+>>> other = SharedMemoryCacheBackend(100, name='doctest', slots=256)
+>>> other.get('my_key')
+'hello, world!'
+>>> import time
+>>> time.sleep(1)
+>>> cache.get('my_key')
+
+>>> cache.get('my_key', 'has expired')
+'has expired'
+>>> cache.set('add_key', 'Initial value')
+>>> cache.add('add_key', 'New value')
+False
+>>> cache.get('add_key')
+'Initial value'
+>>> cache.delete('add_key')
+>>> cache.get('add_key')
+
+>>> cache.set_many({'a': 1, 'b': 2, 'c': 3})
+>>> sorted(cache.get_many(['a', 'b', 'c', 'd']).items())
+[('a', 1), ('b', 2), ('c', 3)]
+>>> cache.delete_many(['a', 'b', 'c'])
+>>> cache.get('a')
+
+>>> cache.set("hello", "world")
+>>> cache.clear()
+>>> other.get("hello")
+
+>>> other.close()
+>>> cache.destroy()
+"""
+try:
+    import fcntl
+except ImportError:
+    raise ImportError("The shared memory backend needs a POSIX system")
+
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from pussycache.cache import BaseCacheBackend, MISSING
+from pussycache.serializers import Codec
+
+MAGIC = b"PUSSYSHM"
+# magic, version, slots, slot size, stripes
+HEADER = struct.Struct("<8sIIII")
+HEADER_SIZE = 64
+# state, key hash, expiry timestamp, key length, value length
+SLOT = struct.Struct("<BQdHI")
+EMPTY, USED, DELETED = 0, 1, 2
+
+
+def _default_directory():
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+class SharedMemoryCacheBackend(BaseCacheBackend):
+    """
+    Store the values in a fixed size hash table, in a memory mapped file
+    shared by all the processes opening it.
+
+    The table is split in ``stripes``, each one guarded by a lock on its
+    bytes in the file (and a lock for the threads of the process), so
+    that processes using different keys seldom wait for each other. A key
+    is stored in one of ``probes`` slots following its hash position. When
+    they are all used, the one expiring first is evicted.
+
+    :param name: name of the cache, the processes using the same name
+                 share the same values
+
+    :param slots: number of entries of the table
+
+    :param slot_size: size of a slot, in bytes. The entries bigger than
+                      this once serialized are not cached.
+
+    :param directory: directory of the file, defaults to ``/dev/shm``
+
+    :param serializer: serializes the values which are neither bytes nor
+                       text, defaults to pickle
+    """
+
+    def __init__(self, timeout, name="default", slots=4096, slot_size=1024,
+                 stripes=64, probes=16, directory=None, serializer=None):
+        self.timeout = timeout
+        self.stripes = min(stripes, slots)
+        self.stripe_slots = max(slots // self.stripes, 1)
+        self.slots = self.stripes * self.stripe_slots
+        self.slot_size = slot_size
+        self.probes = min(probes, self.stripe_slots)
+        self.codec = Codec(serializer)
+        self.evictions = 0
+        self.path = os.path.join(directory or _default_directory(),
+                                 "pussycache-%s" % name)
+        self._thread_locks = [threading.Lock() for i in range(self.stripes)]
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._open()
+
+    def _open(self):
+        """Map the file, initializing it if this is the first process
+        opening it"""
+        size = HEADER_SIZE + self.slots * self.slot_size
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, HEADER_SIZE, 0)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, HEADER.pack(MAGIC, 1, self.slots,
+                                                self.slot_size,
+                                                self.stripes), 0)
+            header = HEADER.unpack(os.pread(self._fd, HEADER.size, 0))
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, HEADER_SIZE, 0)
+        if header != (MAGIC, 1, self.slots, self.slot_size, self.stripes):
+            os.close(self._fd)
+            raise ValueError("%s is not a shared cache of %s slots of %s "
+                             "bytes" % (self.path, self.slots, self.slot_size))
+        self._map = mmap.mmap(self._fd, size)
+
+    def close(self):
+        """Unmap the shared memory of this process"""
+        self._map.close()
+        os.close(self._fd)
+
+    def destroy(self):
+        """Unmap the shared memory and remove it, for all the processes"""
+        self.close()
+        os.unlink(self.path)
+
+    @contextmanager
+    def _locked(self, stripe):
+        length = self.stripe_slots * self.slot_size
+        start = HEADER_SIZE + stripe * length
+        with self._thread_locks[stripe]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, start)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+
+    def _encode_key(self, key):
+        if not isinstance(key, bytes):
+            key = str(key).encode("utf-8")
+        return key
+
+    def _position(self, key):
+        """Return the hash of ``key``, its stripe and its first slot"""
+        key_hash = struct.unpack_from("<Q", hashlib.sha1(key).digest())[0]
+        slot = key_hash % self.slots
+        return key_hash, slot // self.stripe_slots, slot
+
+    def _probe(self, slot):
+        """Return the offsets of the slots a key may be stored in"""
+        stripe_start = slot - slot % self.stripe_slots
+        for i in range(self.probes):
+            position = stripe_start + (slot + i) % self.stripe_slots
+            yield HEADER_SIZE + position * self.slot_size
+
+    def _find(self, key, key_hash, slot):
+        """Return the offset of the slot of ``key`` and its header, or
+        None"""
+        for offset in self._probe(slot):
+            header = SLOT.unpack_from(self._map, offset)
+            if header[0] == EMPTY:
+                return None
+            if header[0] == USED and header[1] == key_hash:
+                start = offset + SLOT.size
+                if self._map[start:start + header[3]] == key:
+                    return offset, header
+        return None
+
+    def _read(self, key, default_value, now):
+        key = self._encode_key(key)
+        key_hash, stripe, slot = self._position(key)
+        with self._locked(stripe):
+            found = self._find(key, key_hash, slot)
+            if found is None:
+                return default_value
+            offset, header = found
+            if header[2] <= now:
+                self._map[offset] = DELETED
+                return default_value
+            start = offset + SLOT.size + header[3]
+            data = self._map[start:start + header[4]]
+        return self.codec.loads(data)
+
+    def _write(self, key, data, expiry, only_if_missing=False):
+        """Store ``data`` in the slot of ``key``, or in a free one. Return
+        whether it has been stored."""
+        key = self._encode_key(key)
+        key_hash, stripe, slot = self._position(key)
+        fits = SLOT.size + len(key) + len(data) <= self.slot_size
+        now = time.time()
+        with self._locked(stripe):
+            found = self._find(key, key_hash, slot)
+            if found is not None:
+                offset, header = found
+                if only_if_missing and header[2] > now:
+                    return False
+                self._map[offset] = DELETED
+            if not fits:
+                return False
+            target, target_expires = None, None
+            for offset in self._probe(slot):
+                state, _, expires, _, _ = SLOT.unpack_from(self._map, offset)
+                if state != USED or expires <= now:
+                    target = offset
+                    break
+                if target is None or expires < target_expires:
+                    target, target_expires = offset, expires
+            else:
+                self.evictions += 1
+            start = target + SLOT.size
+            self._map[start:start + len(key)] = key
+            self._map[start + len(key):start + len(key) + len(data)] = data
+            SLOT.pack_into(self._map, target, USED, key_hash, expiry,
+                           len(key), len(data))
+        return True
+
+    def clear(self):
+        """Clear all the cache"""
+        for stripe in range(self.stripes):
+            with self._locked(stripe):
+                length = self.stripe_slots * self.slot_size
+                start = HEADER_SIZE + stripe * length
+                self._map[start:start + length] = b"\0" * length
+
+    def set(self, key, value, timeout=None):
+        """Add a key/value to the store """
+        self._write(key, self.codec.dumps(value),
+                    time.time() + (timeout or self.timeout))
+
+    def get(self, key, default_value=None):
+        """return the value corresponding to the key or
+        ``default_value`` if expired or does not exist """
+        return self._read(key, default_value, time.time())
+
+    def delete(self, key):
+        """Remove a key/value from the store """
+        key = self._encode_key(key)
+        key_hash, stripe, slot = self._position(key)
+        with self._locked(stripe):
+            found = self._find(key, key_hash, slot)
+            if found is not None:
+                self._map[found[0]] = DELETED
+
+    def add(self, key, value, timeout=None):
+        """Add a key/value to the store unless this key already exists,
+        return whether it has been added"""
+        return self._write(key, self.codec.dumps(value),
+                           time.time() + (timeout or self.timeout),
+                           only_if_missing=True)
+
+    def set_many(self, valuesdict, timeout=None):
+        expiry = time.time() + (timeout or self.timeout)
+        for k, v in valuesdict.items():
+            self._write(k, self.codec.dumps(v), expiry)
+
+    def get_many(self, keys, timeout=None):
+        """Return a dict of the values of the given keys, the keys expired
+        or which do not exist are left out"""
+        now = time.time()
+        response = {}
+        for key in keys:
+            value = self._read(key, MISSING, now)
+            if value is not MISSING:
+                response[key] = value
+        return response
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
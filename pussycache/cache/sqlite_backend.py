@@ -0,0 +1,225 @@
+"""
+A persistent cache backend, in a SQLite database.
+
+>>> import os, tempfile
+>>> from pussycache.cache.sqlite_backend import SQLiteCacheBackend
+>>> path = os.path.join(tempfile.mkdtemp(), 'cache.sqlite3')
+>>> cache = SQLiteCacheBackend(100, path)
+>>> cache.set('my_key', 'hello, world!', 1)
+>>> cache.get('my_key')
+'hello, world!'
+>>> import time
+>>> time.sleep(1)
+>>> cache.get('my_key')
+
+>>> cache.get('my_key', 'has expired')
+'has expired'
+>>> cache.set('add_key', 'Initial value')
+>>> cache.add('add_key', 'New value')
+False
+>>> cache.get('add_key')
+'Initial value'
+>>> cache.delete('add_key')
+>>> cache.get('add_key')
+
+>>> cache.set_many({'a': 1, 'b': 2, 'c': 3})
+>>> sorted(cache.get_many(['a', 'b', 'c', 'd']).items())
+[('a', 1), ('b', 2), ('c', 3)]
+>>> cache.delete_many(['a', 'b', 'c'])
+>>> cache.get('a')
+
+The values survive a restart:
+
+>>> cache.set("hello", "world")
+>>> cache.close()
+>>> cache = SQLiteCacheBackend(100, path)
+>>> cache.get("hello")
+'world'
+>>> cache.clear()
+>>> cache.get("hello")
+
+>>> cache.close()
+"""
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from pussycache.cache import BaseCacheBackend
+from pussycache.serializers import Codec
+
+# Maximum number of parameters of a query, on old SQLite versions
+MAX_VARIABLES = 999
+
+# Number of writes between two purges of the expired entries, without
+# max_entries
+PURGE_EVERY = 1000
+
+
+class SQLiteCacheBackend(BaseCacheBackend):
+    """
+    Store the values in a SQLite database in WAL mode, so that readers do
+    not wait for the writers, and the values survive a restart.
+
+    The writes done within a ``pipeline()`` block, and each ``set_many``,
+    are committed in one transaction, which is rolled back if the block
+    raises. The expired entries are purged every ``max_entries / 10``
+    writes, or every ``PURGE_EVERY`` writes without ``max_entries``.
+
+    :param path: path of the database file, it is shared by the processes
+                 using it
+
+    :param max_entries: approximate maximum number of entries. Over it,
+                        the entries expiring first are culled, every
+                        ``max_entries / 10`` writes.
+
+    :param serializer: serializes the values which are neither bytes nor
+                       text, defaults to pickle
+
+    :param compress_threshold: values bigger than this, in bytes once
+                               serialized, are compressed
+    """
+
+    def __init__(self, timeout, path, max_entries=None, serializer=None,
+                 compress_threshold=None):
+        self.timeout = timeout
+        self.path = path
+        self.max_entries = max_entries
+        self.codec = Codec(serializer, compress_threshold)
+        self._local = threading.local()
+        self._writes = 0
+        self._cull_every = max(max_entries // 10, 1) if max_entries \
+            else PURGE_EVERY
+        with self.pipeline() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS pussycache ("
+                       "key TEXT PRIMARY KEY, "
+                       "value BLOB NOT NULL, "
+                       "expires REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS pussycache_expires "
+                       "ON pussycache (expires)")
+
+    @property
+    def _db(self):
+        """The connection of the current thread"""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.depth = 0
+        return db
+
+    def close(self):
+        """Close the connection of the current thread"""
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    @contextmanager
+    def pipeline(self):
+        """Commit the writes done by the current thread in the block in
+        one transaction, or roll them back if it raises"""
+        db = self._db
+        if self._local.depth == 0:
+            db.execute("BEGIN IMMEDIATE")
+        self._local.depth += 1
+        try:
+            yield db
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                db.execute("ROLLBACK")
+            raise
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            db.execute("COMMIT")
+            self._cull()
+
+    def _cull(self):
+        """Remove the expired entries and, if there are still too many of
+        them, the ones expiring first"""
+        if self._writes < self._cull_every:
+            return
+        self._writes = 0
+        with self.pipeline() as db:
+            db.execute("DELETE FROM pussycache WHERE expires <= ?",
+                       (time.time(),))
+            if not self.max_entries:
+                return
+            count = db.execute("SELECT COUNT(*) FROM pussycache").fetchone()[0]
+            if count > self.max_entries:
+                db.execute("DELETE FROM pussycache WHERE key IN ("
+                           "SELECT key FROM pussycache "
+                           "ORDER BY expires LIMIT ?)",
+                           (count - self.max_entries,))
+
+    def _expires(self, timeout):
+        return time.time() + (timeout or self.timeout)
+
+    def clear(self):
+        """Clear all the cache"""
+        with self.pipeline() as db:
+            db.execute("DELETE FROM pussycache")
+
+    def set(self, key, value, timeout=None):
+        """Add a key/value to the store """
+        self.set_many({key: value}, timeout)
+
+    def get(self, key, default_value=None):
+        """return the value corresponding to the key or
+        ``default_value`` if expired or does not exist """
+        row = self._db.execute("SELECT value FROM pussycache "
+                               "WHERE key = ? AND expires > ?",
+                               (key, time.time())).fetchone()
+        if row is None:
+            return default_value
+        return self.codec.loads(bytes(row[0]))
+
+    def delete(self, key):
+        """Remove a key/value from the store """
+        self.delete_many([key])
+
+    def add(self, key, value, timeout=None):
+        """Add a key/value to the store unless this key already exists,
+        return whether it has been added"""
+        with self.pipeline() as db:
+            db.execute("DELETE FROM pussycache WHERE key = ? AND expires <= ?",
+                       (key, time.time()))
+            added = db.execute("INSERT OR IGNORE INTO pussycache "
+                               "VALUES (?, ?, ?)",
+                               (key, self.codec.dumps(value),
+                                self._expires(timeout))).rowcount == 1
+            self._writes += 1
+        return added
+
+    def set_many(self, valuesdict, timeout=None):
+        expires = self._expires(timeout)
+        with self.pipeline() as db:
+            db.executemany("INSERT OR REPLACE INTO pussycache "
+                           "VALUES (?, ?, ?)",
+                           [(key, self.codec.dumps(value), expires)
+                            for key, value in valuesdict.items()])
+            self._writes += len(valuesdict)
+
+    def get_many(self, keys, timeout=None):
+        """Return a dict of the values of the given keys, the keys expired
+        or which do not exist are left out"""
+        keys = list(keys)
+        now = time.time()
+        response = {}
+        for i in range(0, len(keys), MAX_VARIABLES - 1):
+            chunk = keys[i:i + MAX_VARIABLES - 1]
+            rows = self._db.execute(
+                "SELECT key, value FROM pussycache "
+                "WHERE key IN (%s) AND expires > ?"
+                % ",".join("?" * len(chunk)), chunk + [now])
+            for key, value in rows:
+                response[key] = self.codec.loads(bytes(value))
+        return response
+
+    def delete_many(self, keys):
+        with self.pipeline() as db:
+            db.executemany("DELETE FROM pussycache WHERE key = ?",
+                           [(key,) for key in keys])
@@ -0,0 +1,219 @@
+"""
+A cache backend writing to another one in the background, in batches.
+
+>>> from pussycache.cache import BaseCacheBackend
+>>> from pussycache.cache.write_behind_backend import \\
+...     WriteBehindCacheBackend
+>>> backend = BaseCacheBackend(100)
+>>> cache = WriteBehindCacheBackend(backend, flush_interval=10)
+>>> cache.set('my_key', 'hello, world!')
+>>> cache.get('my_key')
+'hello, world!'
+>>> backend.get('my_key')
+
+>>> cache.flush()
+>>> backend.get('my_key')
+'hello, world!'
+>>> cache.set_many({'a': 1, 'b': 2, 'c': 3})
+>>> sorted(cache.get_many(['a', 'b', 'c', 'd']).items())
+[('a', 1), ('b', 2), ('c', 3)]
+>>> cache.add('a', 'New value')
+False
+>>> cache.delete_many(['a', 'b', 'c'])
+>>> cache.get('a')
+
+>>> cache.close()
+>>> backend.get_many(['a', 'b', 'c'])
+{}
+"""
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+
+from pussycache.cache import BaseCacheBackend
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindCacheBackend(BaseCacheBackend):
+    """
+    Queue the writes to ``backend`` and flush them from a background
+    thread, with one ``set_many`` per batch, so that writing does not wait
+    for a remote cache.
+
+    The queued values are read from the queue, by this process only: the
+    other processes see them once flushed, after ``flush_interval``
+    seconds at most. Deleting a key, or ``add``, removes it from the queue
+    and goes straight to ``backend``. The writes which fail are logged and
+    dropped.
+
+    :param backend: the cache backend written to, usually a
+                    :class:`pussycache.cache.redis_backend.RedisCacheBackend`
+
+    :param batch_size: queued writes flushed at once, a full batch is
+                       flushed without waiting for ``flush_interval``
+
+    :param flush_interval: seconds between two flushes
+
+    :param max_pending: over this number of queued writes, writing flushes
+                        the queue itself
+    """
+
+    def __init__(self, backend, batch_size=100, flush_interval=0.05,
+                 max_pending=10000):
+        self.backend = backend
+        self.timeout = backend.timeout
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.errors = 0
+        # key: (value, timeout), in the order they were written
+        self._pending = OrderedDict()
+        # The batch being written, still read from until it is written
+        self._flushing = {}
+        self._lock = threading.Lock()
+        # Held while writing to the backend, so that a flush does not
+        # write back a key deleted meanwhile
+        self._flush_lock = threading.Lock()
+        self._flusher = _Flusher(self, flush_interval)
+        self._flusher.start()
+
+    def __getattr__(self, name):
+        # Locks, pipelines... are the backend ones
+        if name == "backend":
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+    def close(self):
+        """Flush the queue and stop the background thread"""
+        self._flusher.stop()
+        self.flush()
+
+    def flush(self):
+        """Write all the queued values to the backend"""
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    self._flushing = {}
+                    if not self._pending:
+                        return
+                    while self._pending and \
+                            len(self._flushing) < self.batch_size:
+                        key, pending = self._pending.popitem(last=False)
+                        self._flushing[key] = pending
+                self._write(self._flushing)
+
+    def _write(self, batch):
+        per_timeout = {}
+        for key, (value, timeout) in batch.items():
+            per_timeout.setdefault(timeout, {})[key] = value
+        for timeout, values in per_timeout.items():
+            try:
+                self.backend.set_many(values, timeout)
+            except Exception:
+                self.errors += 1
+                logger.exception("Cannot write %s keys to the cache",
+                                 len(values))
+
+    def _queue(self, valuesdict, timeout):
+        with self._lock:
+            for key, value in valuesdict.items():
+                self._pending.pop(key, None)
+                self._pending[key] = (value, timeout)
+            pending = len(self._pending)
+        if pending >= self.max_pending:
+            self.flush()
+        elif pending >= self.batch_size:
+            self._flusher.wake_up()
+
+    def clear(self):
+        """Clear all the cache"""
+        with self._flush_lock:
+            with self._lock:
+                self._pending.clear()
+            self.backend.clear()
+
+    def set(self, key, value, timeout=None):
+        """Add a key/value to the store """
+        self._queue({key: value}, timeout)
+
+    def get(self, key, default_value=None):
+        """return the value corresponding to the key or
+        ``default_value`` if expired or does not exist """
+        with self._lock:
+            pending = self._pending.get(key) or self._flushing.get(key)
+        if pending is not None:
+            return pending[0]
+        return self.backend.get(key, default_value)
+
+    def delete(self, key):
+        """Remove a key/value from the store """
+        self.delete_many([key])
+
+    def add(self, key, value, timeout=None):
+        """Add a key/value to the store unless this key already exists,
+        return whether it has been added"""
+        with self._flush_lock:
+            with self._lock:
+                if key in self._pending or key in self._flushing:
+                    return False
+            return self.backend.add(key, value, timeout)
+
+    def set_many(self, valuesdict, timeout=None):
+        self._queue(valuesdict, timeout)
+
+    def get_many(self, keys, timeout=None):
+        """Return a dict of the values of the given keys, the keys expired
+        or which do not exist are left out"""
+        response = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                pending = self._pending.get(key) or self._flushing.get(key)
+                if pending is not None:
+                    response[key] = pending[0]
+                else:
+                    missing.append(key)
+        if missing:
+            response.update(self.backend.get_many(missing))
+        return response
+
+    def delete_many(self, keys):
+        with self._flush_lock:
+            with self._lock:
+                for key in keys:
+                    self._pending.pop(key, None)
+            self.backend.delete_many(keys)
+
+
+class _Flusher(threading.Thread):
+    """Daemon thread flushing the queue of a write behind cache backend.
+
+    Only a weak reference to the backend is kept, so the thread stops
+    once the backend is garbage collected.
+    """
+
+    def __init__(self, cache, interval):
+        super(_Flusher, self).__init__(name="pussycache-write-behind")
+        self.daemon = True
+        self.cache = weakref.ref(cache)
+        self.interval = interval
+        self.stopped = False
+        self.wakeup = threading.Event()
+
+    def run(self):
+        while not self.stopped:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            cache = self.cache()
+            if cache is None:
+                return
+            cache.flush()
+            del cache
+
+    def wake_up(self):
+        self.wakeup.set()
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
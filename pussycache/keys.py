@@ -0,0 +1,193 @@
+"""
+Cache keys of the cached methods results.
+
+>>> from pussycache.keys import KeyBuilder
+>>> keys = KeyBuilder("users")
+>>> keys.build("get_user", ("Bob",), {"active": True, "age": 42})
+"users:get_user('Bob'){'active':True,'age':42}"
+
+Keyword arguments order does not matter, nor does the order of dict
+items or set elements:
+
+>>> keys.build("get_user", (), {"age": 42, "active": True})
+"users:get_user(){'active':True,'age':42}"
+>>> keys.build("find", ({"b": {1, 2}, "a": None},), {})
+"users:find({'a':None,'b':set{1,2}}){}"
+
+Keys longer than ``max_length`` are hashed:
+
+>>> key = keys.build("find", (list(range(1000)),), {})
+>>> key.startswith("users:find:") and len(key) <= 200
+True
+
+Objects are encoded with their ``__cache_key__`` method, if any:
+
+>>> class User(object):
+...     def __init__(self, name):
+...         self.name = name
+...     def __cache_key__(self):
+...         return self.name
+>>> keys.build("get_friends", (User("Bob"),), {})
+"users:get_friends(User('Bob')){}"
+"""
+import hashlib
+import inspect
+
+_SCALARS = (type(None), bool, int, float, str, bytes)
+
+
+def _hash(data):
+    return hashlib.blake2b(data, digest_size=16)
+
+
+class UncacheableArgument(TypeError):
+    """An argument cannot be encoded in a cache key.
+
+    Its ``repr`` is the default one, including its memory address, so
+    the key would never be hit: define ``__cache_key__`` on its class."""
+
+
+def cache_key_args(*names):
+    """Declare which arguments of the decorated method form the cache key
+    of its results, the other ones are ignored.
+
+    >>> class Users(object):
+    ...     @cache_key_args("user")
+    ...     def get_user(self, user, timeout=10):
+    ...         pass
+    >>> Users().get_user.cache_key_args
+    ('user',)
+    """
+    def decorator(method):
+        method.cache_key_args = names
+        return method
+    return decorator
+
+
+def takes_self(method, signature=None):
+    """Return whether ``method`` is a function of a class, called with the
+    instance as its first, ``self``, argument"""
+    if inspect.ismethod(method):
+        return False
+    if signature is None:
+        try:
+            signature = inspect.signature(method)
+        except (TypeError, ValueError):  # builtins without a signature
+            return False
+    return next(iter(signature.parameters), None) == "self"
+
+
+class KeyBuilder(object):
+    """Build the cache keys of a proxy.
+
+    :param namespace: prefix of the keys, so that proxies with the same
+                      method names do not share their results
+
+    :param max_length: keys longer than this are hashed
+    """
+
+    def __init__(self, namespace=None, max_length=200):
+        self.namespace = namespace
+        self.prefix = "%s:" % namespace if namespace else ""
+        self.max_length = max_length
+
+    def encode(self, value):
+        """Return a canonical string representation of ``value``"""
+        value_type = type(value)
+        if value_type in _SCALARS:
+            return repr(value)
+        if value_type is tuple:
+            return "(%s)" % ",".join(self.encode(item) for item in value)
+        if value_type is list:
+            return "[%s]" % ",".join(self.encode(item) for item in value)
+        if value_type is dict:
+            return "{%s}" % ",".join(sorted(
+                "%s:%s" % (self.encode(k), self.encode(v))
+                for k, v in value.items()))
+        if value_type in (set, frozenset):
+            return "set{%s}" % ",".join(
+                sorted(self.encode(item) for item in value))
+        cache_key = getattr(value, "__cache_key__", None)
+        if cache_key is not None:
+            return "%s(%s)" % (value_type.__name__, self.encode(cache_key()))
+        if value_type.__repr__ is object.__repr__:
+            raise UncacheableArgument(
+                "%r cannot be part of a cache key, define %s.__cache_key__"
+                % (value, value_type.__name__))
+        return repr(value)
+
+    def build(self, name, args, kwargs):
+        """Return the key of the result of the method ``name`` called with
+        ``args`` and ``kwargs``"""
+        key = "".join((self.prefix, name, self.encode(args),
+                       self.encode(kwargs)))
+        if len(key) > self.max_length:
+            digest = _hash(key.encode("utf-8")).hexdigest()
+            key = "".join((self.prefix, name, ":", digest))
+        return key
+
+    def builder(self, method, key_args=None):
+        """Return a function building the keys of ``method`` results from
+        its arguments.
+
+        The arguments are bound to the parameters of the method, defaults
+        included, so that ``get_user("Bob")`` and ``get_user(user="Bob")``
+        share their key. A function of a class, whose first parameter is
+        ``self``, is called with the instance first, which is left out of
+        the key.
+
+        :param key_args: names of the arguments forming the key, defaults
+                         to the ``cache_key_args`` declared by the method,
+                         or all of them. A ``ValueError`` is raised if the
+                         method has no such argument.
+        """
+        name = method.__name__
+        key_args = key_args or getattr(method, "cache_key_args", None)
+        try:
+            signature = inspect.signature(method)
+        except (TypeError, ValueError):  # builtins without a signature
+            signature = None
+        unbound = signature is not None and takes_self(method, signature)
+        if unbound:
+            signature = signature.replace(
+                parameters=list(signature.parameters.values())[1:])
+        if signature is not None and key_args:
+            for arg in key_args:
+                if arg not in signature.parameters:
+                    raise ValueError("%s has no argument %r, it cannot be "
+                                     "part of its keys" % (name, arg))
+        names = None
+        if signature is not None and all(
+                parameter.kind == parameter.POSITIONAL_OR_KEYWORD
+                for parameter in signature.parameters.values()):
+            names = tuple(signature.parameters)
+
+        def bind(args, kwargs):
+            if unbound:
+                args = args[1:]
+            if names is not None and not kwargs and len(args) == len(names):
+                return dict(zip(names, args))  # fast path, all positional
+            try:
+                bound = signature.bind(*args, **kwargs)
+            except TypeError:
+                raise UncacheableArgument(
+                    "%s arguments do not match its signature" % name)
+            bound.apply_defaults()
+            return dict(bound.arguments)
+
+        if signature is None:
+            def build(args, kwargs):
+                return self.build(name, args, kwargs)
+        elif not key_args:
+            def build(args, kwargs):
+                return self.build(name, (), bind(args, kwargs))
+        else:
+            def build(args, kwargs):
+                arguments = bind(args, kwargs)
+                return self.build(name, (), dict((arg, arguments[arg])
+                                                 for arg in key_args))
+        return build
+
+    def generation_key(self, name):
+        """Return the key holding the generation of the method ``name``"""
+        return "pussycache:generation:%s%s" % (self.prefix, name)
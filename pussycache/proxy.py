@@ -2,8 +2,27 @@
 This proxy manage cached data from a CacheBackend and fresh data from
 a novacoreclient.backend
 """
-from inspect import ismethod
-from .cache import cachedecorator, invalidator
+import threading
+from collections import OrderedDict
+from inspect import ismethod, isroutine
+from types import MethodType
+from .cache import batchdecorator, cachedecorator, invalidator
+from .keys import KeyBuilder, takes_self
+from .stats import Stats, to_prometheus
+
+# Wrappers kept per method of a proxy class, one per cache and namespace
+MAX_WRAPPERS = 100
+
+
+def default_namespace(proxied):
+    """Return the namespace of the cache keys of a proxied object"""
+    proxied_class = type(proxied)
+    namespace = "%s.%s" % (proxied_class.__module__, proxied_class.__name__)
+    cache_key = getattr(proxied, "__cache_key__", None)
+    if cache_key is not None:
+        namespace = "%s(%s)" % (namespace,
+                                KeyBuilder().encode(cache_key()))
+    return namespace
 
 
 class BaseProxy(object):
@@ -13,38 +32,304 @@ class BaseProxy(object):
     :param cache : is a child class of
                          novacoreclient.cache.BaseCacheBackend
 
-    :param cached_methods: is a list of backend methods to be cached
+    :param cached_methods: is a list of backend methods to be cached, or a
+                           dict where keys are the methods to be cached,
+                           the value a dict of options for
+                           :func:`pussycache.cache.cachedecorator`, eg:
+                           ``{"get_users": {"single_flight": True}}``.
+                           With the ``batch`` option, the options are the
+                           ones of :func:`pussycache.cache.batchdecorator`.
 
     :param invalidate_methods: is a dict where keys are the methods
                                invalidating the cache, the value a list of
                                methods to be cache invalidated
+
+    :param namespace: is the prefix of the cache keys, defaults to the
+                      proxied class path followed by what the
+                      ``__cache_key__`` method of the proxied object
+                      returns, if any
+
+    :param instrument: record the hits, misses and latencies of the
+                       methods, see :meth:`stats`
     """
 
     def __init__(self, proxied=None, cache=None, cached_methods=None,
-                 invalidate_methods=None):
+                 invalidate_methods=None, namespace=None, instrument=True):
 
         self._proxied = proxied
         self._cache = cache
         self._cached_methods = cached_methods
         self._invalidate_methods = invalidate_methods
+        if namespace is None:
+            namespace = default_namespace(proxied)
+        self._key_builder = KeyBuilder(namespace)
+        self._stats = Stats(namespace) if instrument else None
 
         self.proxify_methods()
 
     def proxify_methods(self):
         # Cached methods
-        for method in self._cached_methods:
+        cached_methods = self._cached_methods
+        if not isinstance(cached_methods, dict):
+            cached_methods = dict((method, {}) for method in cached_methods)
+        for method, options in cached_methods.items():
             proxied_method = getattr(self._proxied, method)
             if ismethod(proxied_method):
                 setattr(self, method,
-                        cachedecorator(proxied_method, self._cache))
+                        self.cache_method(proxied_method, options))
 
         # Invalidators methods
         for method in self._invalidate_methods:
             proxied_method = getattr(self._proxied, method)
             if ismethod(proxied_method):
-                setattr(self, method, invalidator(
-                        proxied_method,
-                        self._invalidate_methods, self._cache))
+                setattr(self, method,
+                        self.invalidating_method(proxied_method))
+
+    def _method_stats(self, method):
+        if self._stats is not None:
+            return self._stats.method(method.__name__)
+
+    def cache_method(self, method, options):
+        """Return ``method`` caching its results"""
+        if options.get("batch"):
+            return batchdecorator(method, self._cache,
+                                  key_builder=self._key_builder,
+                                  stats=self._method_stats(method),
+                                  **options)
+        return cachedecorator(method, self._cache,
+                              key_builder=self._key_builder,
+                              stats=self._method_stats(method), **options)
+
+    def _key_args(self):
+        """Return the ``key_args`` option of the cached methods"""
+        if not isinstance(self._cached_methods, dict):
+            return {}
+        return dict((name, options.get("key_args"))
+                    for name, options in self._cached_methods.items())
+
+    def invalidating_method(self, method, owner=None):
+        """Return ``method`` invalidating the cache.
+
+        :param owner: the object, or class, of the cached methods, defaults
+                      to the one ``method`` is bound to
+        """
+        return invalidator(method, self._invalidate_methods, self._cache,
+                           self._key_builder, self._method_stats(method),
+                           self._key_args(), owner)
+
+    def stats(self):
+        """Return a dict of the statistics of each method: hits, misses,
+        invalidations and latency histograms of the proxied method
+        (``origin``) and of the cache backend"""
+        if self._stats is None:
+            return {}
+        return self._stats.as_dict()
+
+    def stats_prometheus(self):
+        """Return the statistics in the Prometheus text format"""
+        if self._stats is None:
+            return ""
+        return to_prometheus(self._stats)
 
     def __getattr__(self, value):
         return getattr(self._proxied, value)
+
+
+class CachedMethod(object):
+    """Descriptor of a cached method of the classes made by
+    :func:`proxy_class`.
+
+    The function of the proxied class is wrapped once per cache and
+    namespace, so that the proxies share the state of the wrapper: its
+    single flight, its most recently used keys and its refreshes. On
+    first access, per proxy, the wrapper is bound to the proxied object
+    and kept in the proxy ``__dict__``, which shadows the descriptor
+    afterwards. The class and static methods are wrapped per proxy."""
+
+    def __init__(self, name, options):
+        self.name = name
+        self.options = options
+        self._wrappers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def wrap(self, proxy, method, owner=None):
+        """Return ``method`` wrapped by ``proxy``"""
+        return proxy.cache_method(method, self.options)
+
+    def _shared_wrapper(self, proxy, function):
+        """Return the wrapper of ``function`` shared by the proxies with
+        the cache and namespace of ``proxy``, None if it does not take
+        ``self``"""
+        key = (id(proxy._cache), proxy._key_builder.namespace, function)
+        with self._lock:
+            try:
+                self._wrappers.move_to_end(key)
+                return self._wrappers[key][1]
+            except KeyError:
+                pass
+            wrapper = None
+            if takes_self(function):
+                wrapper = self.wrap(proxy, function, type(proxy._proxied))
+            # The cache is kept along, so that its id is not reused
+            self._wrappers[key] = (proxy._cache, wrapper)
+            if len(self._wrappers) > MAX_WRAPPERS:
+                self._wrappers.popitem(last=False)
+            return wrapper
+
+    def __get__(self, proxy, owner=None):
+        if proxy is None:
+            return self
+        proxied = proxy._proxied
+        function = getattr(type(proxied), self.name, None)
+        wrapper = None
+        if function is not None:
+            wrapper = self._shared_wrapper(proxy, function)
+        if wrapper is None:
+            method = self.wrap(proxy, getattr(proxied, self.name))
+        else:
+            method = MethodType(wrapper, proxied)
+        proxy.__dict__[self.name] = method
+        return method
+
+
+class InvalidatingMethod(CachedMethod):
+    """Descriptor of an invalidating method of the classes made by
+    :func:`proxy_class`, wrapped like the cached ones"""
+
+    def __init__(self, name):
+        super(InvalidatingMethod, self).__init__(name, None)
+
+    def wrap(self, proxy, method, owner=None):
+        return proxy.invalidating_method(method, owner)
+
+
+class ForwardedMethod(CachedMethod):
+    """Descriptor of a method of the proxied object, kept in the proxy
+    ``__dict__`` on first access"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, proxy, owner=None):
+        if proxy is None:
+            return self
+        method = proxy.__dict__[self.name] = getattr(proxy._proxied,
+                                                     self.name)
+        return method
+
+
+class ForwardedAttribute(ForwardedMethod):
+    """Descriptor of an attribute of the proxied class, read from the
+    proxied object on every access"""
+
+    def __get__(self, proxy, owner=None):
+        if proxy is None:
+            return self
+        return getattr(proxy._proxied, self.name)
+
+
+def proxies_prometheus(*proxies):
+    """Return the statistics of several proxies in one Prometheus
+    exposition, the proxies which are not instrumented are left out.
+
+    The instances of a class made by :func:`proxy_class` share their
+    statistics, one of them stands for all."""
+    return to_prometheus(*[proxy._stats for proxy in proxies
+                           if proxy._stats is not None])
+
+
+def _freeze(value):
+    """Return a hashable equivalent of a proxy configuration"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+_proxy_classes = {}
+_proxy_classes_lock = threading.Lock()
+
+
+def proxy_class(proxied_class, cached_methods=None, invalidate_methods=None,
+                namespace=None, instrument=True, base=BaseProxy):
+    """Return a proxy class of the instances of ``proxied_class``.
+
+    The class is made once per class and configuration, the parameters
+    being the ones of :class:`BaseProxy`. Its instances are built from the
+    proxied object and the cache only, which is cheap: the methods are
+    wrapped once per cache and namespace, bound to the proxied object on
+    first use, and the attributes of the proxied class are
+    forwarded by descriptors instead of ``__getattr__``, which is only
+    left for the attributes of the proxied instances. The statistics are
+    shared by all the instances of the class.
+
+    >>> from pussycache.cache import BaseCacheBackend
+    >>> class Users(object):
+    ...     def get_users(self):
+    ...         return ["Adam", "Bob"]
+    ...     def delete_user(self, user):
+    ...         pass
+    >>> UsersProxy = proxy_class(Users, ["get_users"],
+    ...                          {"delete_user": ["get_users"]})
+    >>> UsersProxy is proxy_class(Users, ["get_users"],
+    ...                           {"delete_user": ["get_users"]})
+    True
+    >>> UsersProxy(Users(), BaseCacheBackend(30)).get_users()
+    ['Adam', 'Bob']
+
+    :param base: the proxy class to derive from, eg:
+                 :class:`pussycache.async_proxy.AsyncProxy`
+    """
+    cached_methods = cached_methods or {}
+    invalidate_methods = invalidate_methods or {}
+    config = (proxied_class, base, _freeze(cached_methods),
+              _freeze(invalidate_methods), namespace, instrument)
+    try:
+        return _proxy_classes[config]
+    except KeyError:
+        pass
+    with _proxy_classes_lock:
+        if config not in _proxy_classes:
+            _proxy_classes[config] = _make_proxy_class(
+                proxied_class, base, cached_methods, invalidate_methods,
+                namespace, instrument)
+        return _proxy_classes[config]
+
+
+def _make_proxy_class(proxied_class, base, cached_methods,
+                      invalidate_methods, namespace, instrument):
+    if not isinstance(cached_methods, dict):
+        cached_methods = dict((method, {}) for method in cached_methods)
+    class_path = "%s.%s" % (proxied_class.__module__, proxied_class.__name__)
+    key_builder = None
+    if namespace is not None or \
+            getattr(proxied_class, "__cache_key__", None) is None:
+        key_builder = KeyBuilder(namespace or class_path)
+
+    def __init__(self, proxied, cache):
+        self._proxied = proxied
+        self._cache = cache
+        if key_builder is None:
+            self._key_builder = KeyBuilder(default_namespace(proxied))
+
+    attributes = {
+        "__init__": __init__,
+        "__doc__": "Proxy of %s instances" % class_path,
+        "_cached_methods": cached_methods,
+        "_invalidate_methods": invalidate_methods,
+        "_key_builder": key_builder,
+        "_stats": Stats(namespace or class_path) if instrument else None,
+    }
+    for name in dir(proxied_class):
+        if name.startswith("__") or hasattr(base, name):
+            continue
+        if isroutine(getattr(proxied_class, name)):
+            attributes[name] = ForwardedMethod(name)
+        else:
+            attributes[name] = ForwardedAttribute(name)
+    for name, options in cached_methods.items():
+        attributes[name] = CachedMethod(name, options)
+    for name in invalidate_methods:
+        attributes[name] = InvalidatingMethod(name)
+    return type("%sProxy" % proxied_class.__name__, (base,), attributes)
@@ -0,0 +1,85 @@
+"""
+Background refresh of cached results.
+
+>>> from pussycache.refresh import RefreshExecutor
+>>> executor = RefreshExecutor(max_workers=2)
+>>> results = []
+>>> executor.submit('my_key', lambda: results.append('refreshed'))
+True
+>>> executor.join()
+>>> results
+['refreshed']
+"""
+import logging
+import threading
+import queue
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshExecutor(object):
+    """A bounded pool of daemon threads refreshing cache entries.
+
+    A key is refreshed only once at a time, and refreshes are dropped
+    rather than queued when ``max_pending`` of them are already waiting.
+
+    :param max_workers: maximum number of refreshing threads
+
+    :param max_pending: maximum number of refreshes waiting for a thread
+    """
+
+    def __init__(self, max_workers=4, max_pending=1000):
+        self.max_workers = max_workers
+        self._queue = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._workers = []
+
+    def submit(self, key, func):
+        """Call ``func`` in a worker thread unless ``key`` is already being
+        refreshed or there are too many pending refreshes. Return whether
+        it has been scheduled."""
+        with self._lock:
+            if key in self._pending:
+                return False
+            try:
+                self._queue.put_nowait((key, func))
+            except queue.Full:
+                return False
+            self._pending.add(key)
+            if len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._work,
+                                          name="pussycache-refresh")
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+        return True
+
+    def _work(self):
+        while True:
+            key, func = self._queue.get()
+            try:
+                func()
+            except Exception:
+                logger.exception("Could not refresh %r", key)
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+                self._queue.task_done()
+
+    def join(self):
+        """Wait for all the scheduled refreshes to be done"""
+        self._queue.join()
+
+
+_default_executor = None
+_default_executor_lock = threading.Lock()
+
+
+def get_default_executor():
+    """Return the executor shared by the cached methods not given one"""
+    global _default_executor
+    with _default_executor_lock:
+        if _default_executor is None:
+            _default_executor = RefreshExecutor()
+        return _default_executor
@@ -0,0 +1,215 @@
+"""
+Serialization of the values stored by the remote cache backends.
+
+>>> from pussycache.serializers import Codec, JSONSerializer
+>>> codec = Codec()
+>>> codec.loads(codec.dumps({'a': [1, 2, 3]}))
+{'a': [1, 2, 3]}
+
+Bytes and text are stored as is, without being serialized. Memory views,
+which cannot be pickled, are stored as is too, and loaded as bytes:
+
+>>> codec.dumps(b'raw bytes')
+b'rraw bytes'
+>>> codec.loads(codec.dumps(memoryview(b'a view')))
+b'a view'
+>>> codec.loads(codec.dumps(u'text'))
+'text'
+
+Values bigger than ``compress_threshold`` bytes once serialized are
+compressed:
+
+>>> codec = Codec(JSONSerializer(), compress_threshold=100)
+>>> data = codec.dumps([0] * 1000)
+>>> len(data) < 1000
+True
+>>> codec.loads(data) == [0] * 1000
+True
+
+With pickle protocol 5, the buffers of the values, like the data of NumPy
+arrays, are stored out-of-band after the pickle: they are not copied into
+it, and the loaded values use the data read from the cache as is.
+
+>>> import pickle
+>>> data = Codec().dumps([pickle.PickleBuffer(b'x' * 1000)])
+>>> data[:1]
+b'o'
+>>> Codec().loads(data)[0].tobytes() == b'x' * 1000
+True
+"""
+import json
+import pickle
+import struct
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Headers of the encoded values, upper case when compressed
+RAW = b'r'
+TEXT = b't'
+SERIALIZED = b's'
+# Pickle followed by its out-of-band buffers
+OUT_OF_BAND = b'o'
+COMPRESSED = {RAW: b'R', TEXT: b'T', SERIALIZED: b'S', OUT_OF_BAND: b'O'}
+UNCOMPRESSED = dict((v, k) for k, v in COMPRESSED.items())
+# Values written by pussycache < 1.5, pickled in a dict
+LEGACY = b'\x80'
+# Values split in chunks by the redis backends
+CHUNKED = b'c'
+
+# Number of out-of-band buffers, then the length of the pickle and of each
+# buffer
+LENGTH = struct.Struct('<Q')
+
+
+class PickleSerializer(object):
+    """Serialize values with pickle, using its fastest protocol.
+
+    From protocol 5, the buffers of the values supporting it, like NumPy
+    arrays, are kept out-of-band by :meth:`dumps_buffers`. The values
+    loaded from out-of-band buffers share their memory with the read data,
+    arrays are read only.
+    """
+
+    def __init__(self, protocol=pickle.HIGHEST_PROTOCOL):
+        self.protocol = protocol
+
+    def dumps(self, value):
+        return pickle.dumps(value, self.protocol)
+
+    def dumps_buffers(self, value):
+        """Return the pickle of ``value`` and the list of its out-of-band
+        buffers, as memory views"""
+        if self.protocol < 5:
+            return self.dumps(value), []
+        buffers = []
+        data = pickle.dumps(value, self.protocol,
+                            buffer_callback=buffers.append)
+        return data, [buffer.raw() for buffer in buffers]
+
+    def loads(self, data, buffers=None):
+        if buffers:
+            return pickle.loads(data, buffers=buffers)
+        return pickle.loads(data)
+
+
+class JSONSerializer(object):
+    """Serialize values with json, tuples are loaded as lists"""
+
+    def dumps(self, value):
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data.decode('utf-8'))
+
+
+class MsgpackSerializer(object):
+    """Serialize values with msgpack, tuples are loaded as lists"""
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("You need to install msgpack \
+(eg: pip install msgpack) to use this serializer")
+
+    def dumps(self, value):
+        return msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+class Codec(object):
+    """Encode values into bytes prefixed by a one byte header.
+
+    :param serializer: serializes the values which are neither bytes nor
+                       text, defaults to :class:`PickleSerializer`
+
+    :param compress_threshold: minimum size of the data to compress, in
+                               bytes, None to never compress
+
+    :param compressor: a module or object with ``compress`` and
+                       ``decompress`` functions, like :mod:`zlib` (the
+                       default) or ``lz4.frame``
+
+    A serializer with a ``dumps_buffers`` method, like
+    :class:`PickleSerializer`, loads memory views and keeps the buffers of
+    the values out-of-band: the values are not copied into the pickle and
+    are loaded without being copied out of the read data.
+    """
+
+    def __init__(self, serializer=None, compress_threshold=None,
+                 compressor=None):
+        self.serializer = serializer or PickleSerializer()
+        self.compress_threshold = compress_threshold
+        self.compressor = compressor or zlib
+
+    def dumps(self, value):
+        if isinstance(value, bytes):
+            header, parts = RAW, [value]
+        elif isinstance(value, memoryview):
+            header, parts = RAW, [_raw_bytes(value)]
+        elif isinstance(value, str):
+            header, parts = TEXT, [value.encode('utf-8')]
+        else:
+            header, parts = self._serialize(value)
+        if self.compress_threshold is not None \
+                and sum(len(part) for part in parts) >= \
+                self.compress_threshold:
+            header = COMPRESSED[header]
+            parts = [self.compressor.compress(b''.join(parts))]
+        # The out-of-band buffers are copied once, into the encoded value
+        return b''.join([header] + parts)
+
+    def _serialize(self, value):
+        """Return the header and the parts of the serialized ``value``"""
+        if not hasattr(self.serializer, 'dumps_buffers'):
+            return SERIALIZED, [self.serializer.dumps(value)]
+        data, buffers = self.serializer.dumps_buffers(value)
+        if not buffers:
+            return SERIALIZED, [data]
+        lengths = [len(buffers), len(data)] + [len(b) for b in buffers]
+        return OUT_OF_BAND, [b''.join(LENGTH.pack(n) for n in lengths),
+                             data] + buffers
+
+    def loads(self, data):
+        header = data[:1]
+        if header == LEGACY:
+            return pickle.loads(data)["value"]
+        body = memoryview(data)[1:]
+        if header in UNCOMPRESSED:
+            header = UNCOMPRESSED[header]
+            body = memoryview(self.compressor.decompress(body))
+        if header == RAW:
+            return body.tobytes()
+        if header == TEXT:
+            return body.tobytes().decode('utf-8')
+        if not hasattr(self.serializer, 'dumps_buffers'):
+            return self.serializer.loads(body.tobytes())
+        if header == OUT_OF_BAND:
+            return self.serializer.loads(*_split_buffers(body))
+        return self.serializer.loads(body)
+
+
+def _raw_bytes(view):
+    """Return the bytes of a memory view, without copying them if they are
+    contiguous"""
+    if view.c_contiguous:
+        return view.cast('B')
+    return view.tobytes()
+
+
+def _split_buffers(body):
+    """Return the pickle and the out-of-band buffers of ``body``, memory
+    views of it"""
+    count = LENGTH.unpack_from(body)[0]
+    lengths = [LENGTH.unpack_from(body, LENGTH.size * (i + 1))[0]
+               for i in range(count + 1)]
+    start = LENGTH.size * (count + 2)
+    parts = []
+    for length in lengths:
+        parts.append(body[start:start + length])
+        start += length
+    return parts[0], parts[1:]
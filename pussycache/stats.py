@@ -0,0 +1,209 @@
+"""
+Counters and latency histograms of the cached methods.
+
+>>> from pussycache.stats import Stats, to_prometheus
+>>> stats = Stats("users")
+>>> method = stats.method("get_user")
+>>> method.hits += 1
+>>> method.origin.observe(0.02)
+>>> stats.as_dict()["get_user"]["hits"]
+1
+>>> stats.as_dict()["get_user"]["origin"]["count"]
+1
+>>> print(to_prometheus(stats))  # doctest: +ELLIPSIS
+# HELP pussycache_hits_total Results found in the cache.
+# TYPE pussycache_hits_total counter
+pussycache_hits_total{namespace="users",method="get_user"} 1
+...
+pussycache_origin_seconds_count{namespace="users",method="get_user"} 1
+...
+"""
+from bisect import bisect_left
+from timeit import default_timer
+
+#: Upper bounds of the latency histograms buckets, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+#: One read of the cache backend in ``READ_SAMPLING`` is timed
+READ_SAMPLING = 10
+
+COUNTERS = (
+    ("hits", "Results found in the cache."),
+    ("misses", "Results not found in the cache."),
+    ("invalidations", "Calls of the invalidating methods."),
+    ("invalidated_methods", "Cached methods invalidated."),
+    ("invalidated_keys", "Cached results invalidated by key."),
+)
+HISTOGRAMS = (
+    ("origin", "Time spent in the proxied methods."),
+    ("cache_get", "Time spent reading the cache backend, sampled."),
+    ("cache_set", "Time spent writing the cache backend."),
+)
+
+
+class Histogram(object):
+    """Count observed values in fixed buckets"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def percentile(self, percent):
+        """Return the upper bound of the bucket holding the given
+        percentile, None if there are no values or it is over the last
+        bucket"""
+        rank = self.count * percent / 100.0
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return None
+
+    def as_dict(self):
+        return {"count": self.count, "sum": self.sum,
+                "p50": self.percentile(50), "p99": self.percentile(99)}
+
+
+class MethodStats(object):
+    """Statistics of a cached or invalidating method.
+
+    Counters are not locked: under concurrent threads they are
+    approximate.
+    """
+
+    def __init__(self):
+        for name, _ in COUNTERS:
+            setattr(self, name, 0)
+        for name, _ in HISTOGRAMS:
+            setattr(self, name, Histogram())
+
+    def as_dict(self):
+        response = dict((name, getattr(self, name)) for name, _ in COUNTERS)
+        for name, _ in HISTOGRAMS:
+            response[name] = getattr(self, name).as_dict()
+        return response
+
+
+class Stats(object):
+    """Statistics of the methods of a proxy"""
+
+    def __init__(self, namespace=None):
+        self.namespace = namespace
+        self.methods = {}
+
+    def method(self, name):
+        """Return the statistics of the method ``name``"""
+        try:
+            return self.methods[name]
+        except KeyError:
+            return self.methods.setdefault(name, MethodStats())
+
+    def as_dict(self):
+        return dict((name, method.as_dict())
+                    for name, method in self.methods.items())
+
+
+class InstrumentedCache(object):
+    """Time the writes of a cache backend, and one read in
+    ``sampling``, so that most hits only cost their counter"""
+
+    def __init__(self, cache, stats, sampling=READ_SAMPLING):
+        self.cache = cache
+        self.stats = stats
+        self.sampling = sampling
+        self._reads = 0
+
+    def __getattr__(self, name):
+        if name == "cache":
+            raise AttributeError(name)
+        return getattr(self.cache, name)
+
+    def get_many(self, keys, timeout=None):
+        self._reads += 1
+        if self._reads % self.sampling != 1 % self.sampling:
+            return self.cache.get_many(keys)
+        start = default_timer()
+        try:
+            return self.cache.get_many(keys)
+        finally:
+            self.stats.cache_get.observe(default_timer() - start)
+
+    def set(self, key, value, timeout=None):
+        start = default_timer()
+        try:
+            self.cache.set(key, value, timeout)
+        finally:
+            self.stats.cache_set.observe(default_timer() - start)
+
+    def set_many(self, valuesdict, timeout=None):
+        start = default_timer()
+        try:
+            self.cache.set_many(valuesdict, timeout)
+        finally:
+            self.stats.cache_set.observe(default_timer() - start)
+
+
+def timed(method, histogram):
+    """Return ``method`` recording its duration into ``histogram``"""
+    def timed_method(*args, **kwargs):
+        start = default_timer()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            histogram.observe(default_timer() - start)
+    timed_method.__name__ = method.__name__
+    return timed_method
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def to_prometheus(*stats):
+    """Return the given :class:`Stats` in the Prometheus text format"""
+    lines = []
+
+    def labels(namespace, method, **extra):
+        pairs = [("namespace", namespace), ("method", method)]
+        pairs += sorted(extra.items())
+        return ",".join('%s="%s"' % (k, _escape(v)) for k, v in pairs
+                        if v is not None)
+
+    for name, help in COUNTERS:
+        metric = "pussycache_%s_total" % name
+        lines.append("# HELP %s %s" % (metric, help))
+        lines.append("# TYPE %s counter" % metric)
+        for proxy in stats:
+            for method, method_stats in sorted(proxy.methods.items()):
+                lines.append("%s{%s} %s" % (metric,
+                                            labels(proxy.namespace, method),
+                                            getattr(method_stats, name)))
+    for name, help in HISTOGRAMS:
+        metric = "pussycache_%s_seconds" % name
+        lines.append("# HELP %s %s" % (metric, help))
+        lines.append("# TYPE %s histogram" % metric)
+        for proxy in stats:
+            for method, method_stats in sorted(proxy.methods.items()):
+                histogram = getattr(method_stats, name)
+                cumulated = 0
+                bounds = [repr(bound) for bound in histogram.buckets]
+                for bound, count in zip(bounds + ["+Inf"], histogram.counts):
+                    cumulated += count
+                    lines.append("%s_bucket{%s} %s" % (
+                        metric, labels(proxy.namespace, method, le=bound),
+                        cumulated))
+                method_labels = labels(proxy.namespace, method)
+                lines.append("%s_sum{%s} %r" % (metric, method_labels,
+                                                histogram.sum))
+                lines.append("%s_count{%s} %s" % (metric, method_labels,
+                                                  histogram.count))
+    return "\n".join(lines) + "\n"
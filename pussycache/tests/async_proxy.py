@@ -0,0 +1,91 @@
+import asyncio
+from unittest import TestCase
+
+from pussycache.async_proxy import AsyncProxy
+from pussycache.cache import BaseCacheBackend
+from pussycache.cache.async_backend import AsyncCacheBackend
+from pussycache.proxy import proxy_class
+
+
+class AsyncExample(object):
+
+    def __init__(self):
+        self.users = ["Adam", "Bob", "Peter"]
+        self.calls = 0
+
+    async def get_users(self):
+        self.calls += 1
+        await asyncio.sleep(0.1)
+        return list(self.users)
+
+    async def find_user(self, name):
+        self.calls += 1
+        return name if name in self.users else None
+
+    async def delete_user(self, user):
+        self.users = [usr for usr in self.users if usr != user]
+        return self.users
+
+    def sync_method(self):
+        return None
+
+
+class TestAsyncProxy(TestCase):
+
+    def setUp(self):
+        self.proxied = AsyncExample()
+        self.proxy = AsyncProxy(
+            self.proxied, cache=AsyncCacheBackend(BaseCacheBackend(300)),
+            cached_methods=["get_users", "find_user"],
+            invalidate_methods={"delete_user": ["get_users"]})
+
+    def test_results_are_cached(self):
+        async def calls():
+            first = await self.proxy.get_users()
+            second = await self.proxy.get_users()
+            return first, second
+        first, second = asyncio.run(calls())
+        self.assertEqual(first, ["Adam", "Bob", "Peter"])
+        self.assertEqual(second, first)
+        self.assertEqual(self.proxied.calls, 1)
+
+    def test_none_results_are_cached(self):
+        async def calls():
+            return [await self.proxy.find_user("Nobody") for i in range(3)]
+        self.assertEqual(asyncio.run(calls()), [None] * 3)
+        self.assertEqual(self.proxied.calls, 1)
+
+    def test_concurrent_calls_are_deduplicated(self):
+        async def calls():
+            return await asyncio.gather(
+                *[self.proxy.get_users() for i in range(10)])
+        results = asyncio.run(calls())
+        self.assertEqual(results, [["Adam", "Bob", "Peter"]] * 10)
+        self.assertEqual(self.proxied.calls, 1)
+
+    def test_invalidation(self):
+        async def calls():
+            await self.proxy.get_users()
+            await self.proxy.delete_user("Bob")
+            return await self.proxy.get_users()
+        self.assertEqual(asyncio.run(calls()), ["Adam", "Peter"])
+        self.assertEqual(self.proxied.calls, 2)
+
+    def test_sync_methods_are_refused(self):
+        self.assertRaises(TypeError, AsyncProxy, self.proxied,
+                          cache=AsyncCacheBackend(BaseCacheBackend(300)),
+                          cached_methods=["sync_method"],
+                          invalidate_methods={})
+
+    def test_proxies_of_a_class_share_their_calls(self):
+        Proxy = proxy_class(AsyncExample, ["get_users"], base=AsyncProxy)
+        cache = AsyncCacheBackend(BaseCacheBackend(300))
+        proxied = [AsyncExample() for i in range(2)]
+
+        async def calls():
+            return await asyncio.gather(
+                *[Proxy(proxied[i % 2], cache).get_users()
+                  for i in range(10)])
+        results = asyncio.run(calls())
+        self.assertEqual(results, [["Adam", "Bob", "Peter"]] * 10)
+        self.assertEqual(sum(example.calls for example in proxied), 1)
@@ -0,0 +1,243 @@
+"""
+Benchmarks of the cached methods and of the cache backends.
+
+Run them with ``make bench``, or::
+
+    python -m pussycache.tests.benchmarks --save baseline.json
+    python -m pussycache.tests.benchmarks --baseline baseline.json
+
+Each benchmark reports its throughput and latency percentiles. Against a
+baseline, the ones slower than ``--tolerance`` make the command fail.
+
+The redis benchmarks need a redis-server, they are skipped otherwise.
+"""
+import argparse
+import json
+import pickle
+import re
+import sys
+from timeit import default_timer
+
+from pussycache.cache import BaseCacheBackend, cachedecorator, invalidator
+from pussycache.proxy import BaseProxy, proxy_class
+from pussycache.serializers import Codec
+
+try:
+    from pussycache.cache.redis_backend import RedisCacheBackend
+except ImportError:
+    RedisCacheBackend = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PERCENTILES = (50, 95, 99)
+
+
+class Example(object):
+
+    def __init__(self):
+        self.name = "example"
+
+    def get_value(self, value):
+        return value
+
+    def set_value(self, value):
+        pass
+
+
+def measure(func, iterations, repeat=1):
+    """Call ``func`` ``iterations`` times and return its statistics.
+
+    :param repeat: number of operations done by each call of ``func``,
+                   the results are per operation
+    """
+    timings = []
+    for i in range(iterations):
+        start = default_timer()
+        func()
+        timings.append(default_timer() - start)
+    timings.sort()
+    total = sum(timings)
+    result = {"ops": iterations * repeat / total if total else float("inf")}
+    for percent in PERCENTILES:
+        index = min(int(len(timings) * percent / 100.0), len(timings) - 1)
+        result["p%s" % percent] = timings[index] / repeat
+    return result
+
+
+def bench_decorator():
+    cache = BaseCacheBackend(300, max_entries=10000)
+    cached = cachedecorator(Example().get_value, cache)
+    cached(1)
+    yield "decorator.hit", lambda: cached(1), 1
+
+    values = iter(range(10 ** 9))
+    yield "decorator.miss", lambda: cached(next(values)), 1
+
+
+def bench_invalidator():
+    # Invalidating renews the generation of the method, its cost should
+    # not depend on the number of results cached
+    for count in (10, 1000, 100000):
+        cache = BaseCacheBackend(300)
+        cached = cachedecorator(Example().get_value, cache)
+        for value in range(count):
+            cached(value)
+        invalidate = invalidator(Example().set_value,
+                                 {"set_value": ["get_value"]}, cache)
+        yield "invalidator.%s_keys" % count, lambda: invalidate(1), 1
+
+
+def bench_proxy():
+    cached_methods = ["get_value"]
+    cache = BaseCacheBackend(300)
+
+    def build():
+        return BaseProxy(Example(), cache=cache,
+                         cached_methods=cached_methods,
+                         invalidate_methods={})
+    yield "proxy.construction", build, 1
+
+    proxy = build()
+    yield "proxy.attribute", lambda: proxy.name, 1
+
+    Proxy = proxy_class(Example, cached_methods)
+    yield "proxy_class.construction", lambda: Proxy(Example(), cache), 1
+
+    proxy = Proxy(Example(), cache)
+    yield "proxy_class.method", lambda: proxy.get_value, 1
+
+
+def bench_codec(size=2 ** 20):
+    """Encode and decode values holding ``size`` bytes"""
+    values = {"bytes": b"x" * size, "pickled": [b"x" * size]}
+    if pickle.HIGHEST_PROTOCOL >= 5:
+        values["out_of_band"] = [pickle.PickleBuffer(b"x" * size)]
+    if numpy is not None:
+        values["array"] = numpy.zeros(size // 8)
+    codec = Codec()
+
+    def dumps(value):
+        return lambda: codec.dumps(value)
+
+    def loads(data):
+        return lambda: codec.loads(data)
+
+    for name, value in sorted(values.items()):
+        yield "codec.dumps_%s" % name, dumps(value), 1
+        yield "codec.loads_%s" % name, loads(codec.dumps(value)), 1
+
+
+def bench_backend(name, cache, batch=100):
+    keys = ["pussycache:bench:%s" % i for i in range(batch)]
+    values = dict((key, key) for key in keys)
+
+    def set_single():
+        for key in keys:
+            cache.set(key, key)
+
+    def get_single():
+        for key in keys:
+            cache.get(key)
+
+    yield "%s.set" % name, set_single, batch
+    yield "%s.set_many" % name, lambda: cache.set_many(values), batch
+    yield "%s.get" % name, get_single, batch
+    yield "%s.get_many" % name, lambda: cache.get_many(keys), batch
+    cache.delete_many(keys)
+
+
+def bench_backends(redis_host="localhost", redis_port=6379):
+    for result in bench_backend("memory", BaseCacheBackend(300)):
+        yield result
+    if RedisCacheBackend is None:
+        print("Skipping the redis benchmarks: redis is not installed",
+              file=sys.stderr)
+        return
+    cache = RedisCacheBackend(300, redis_host, redis_port)
+    try:
+        cache.db.ping()
+    except Exception:
+        print("Skipping the redis benchmarks: redis-server is not running",
+              file=sys.stderr)
+        return
+    for result in bench_backend("redis", cache):
+        yield result
+
+
+def run(iterations, only=None, **redis_options):
+    """Return a dict of the statistics of each benchmark whose name
+    matches ``only``"""
+    results = {}
+    benchmarks = [bench_decorator(), bench_invalidator(), bench_proxy(),
+                  bench_codec(), bench_backends(**redis_options)]
+    for benchmark in benchmarks:
+        for name, func, repeat in benchmark:
+            if only is None or re.search(only, name):
+                results[name] = measure(func, max(iterations // repeat, 10),
+                                        repeat)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return the names of the benchmarks slower than their baseline by
+    more than ``tolerance``"""
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name in baseline:
+            change = result["ops"] / baseline[name]["ops"] - 1
+            if change < -tolerance:
+                regressions.append(name)
+            result["change"] = change
+    return regressions
+
+
+def report(results):
+    print("%-28s %14s %10s %10s %10s %8s" % (
+        "benchmark", "ops/s", "p50 us", "p95 us", "p99 us", "change"))
+    for name, result in sorted(results.items()):
+        change = result.get("change")
+        print("%-28s %14.0f %10.2f %10.2f %10.2f %8s" % (
+            name, result["ops"], result["p50"] * 1e6, result["p95"] * 1e6,
+            result["p99"] * 1e6,
+            "" if change is None else "%+.1f%%" % (change * 100)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--iterations", type=int, default=10000)
+    parser.add_argument("--only", help="run the benchmarks matching this "
+                                       "regular expression")
+    parser.add_argument("--save", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare with the results "
+                                           "saved in this file")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="slowdown allowed against the baseline, "
+                             "default: 0.1")
+    parser.add_argument("--redis-host", default="localhost")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    options = parser.parse_args(argv)
+
+    results = run(options.iterations, options.only,
+                  redis_host=options.redis_host,
+                  redis_port=options.redis_port)
+    regressions = []
+    if options.baseline:
+        with open(options.baseline) as baseline:
+            regressions = compare(results, json.load(baseline),
+                                  options.tolerance)
+    report(results)
+    if options.save:
+        with open(options.save, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if regressions:
+        print("Slower than the baseline: %s" % ", ".join(regressions),
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,7 @@
+import time
 from unittest import TestCase
+
+import pussycache.cache
 from pussycache.cache import BaseCacheBackend
 
 
@@ -10,3 +13,111 @@ class TestCacheBackend(TestCase):
         cache.add('add_key', 'Initial value')
         result = cache.get('add_key')
         self.assertEqual(result, 'Initial value')
+
+    def test_add_does_not_replace_none(self):
+        cache = BaseCacheBackend(100)
+        cache.set('add_key', None)
+        self.assertFalse(cache.add('add_key', 'New value'))
+        self.assertEqual(cache.get('add_key', 'default'), None)
+
+    def test_max_entries_evicts_least_recently_used(self):
+        cache = BaseCacheBackend(100, max_entries=3)
+        cache.set_many({'a': 1, 'b': 2, 'c': 3})
+        cache.get('a')
+        cache.set('d', 4)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(len(cache.store), 3)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_max_size(self):
+        sizes = {'small': 10, 'big': 60}
+        cache = BaseCacheBackend(100, max_size=100,
+                                 sizeof=lambda key, value: sizes[value])
+        for i in range(5):
+            cache.set(i, 'small')
+        self.assertEqual(cache.size, 50)
+        cache.set('x', 'big')
+        self.assertEqual(cache.size, 100)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.get(0), None)
+        cache.delete('x')
+        self.assertEqual(cache.size, 40)
+        # Entries bigger than the whole store are not kept
+        cache = BaseCacheBackend(100, max_size=50,
+                                 sizeof=lambda key, value: sizes[value])
+        cache.set('x', 'big')
+        self.assertEqual(cache.get('x'), None)
+        self.assertEqual(cache.size, 0)
+
+    def test_max_size_counts_buffers(self):
+        cache = BaseCacheBackend(100, max_size=10000)
+        data = memoryview(b'x' * 6000)
+        cache.set('a', (1, data, None))
+        self.assertTrue(cache.size > 6000)
+        self.assertTrue(cache.get('a')[1] is data)
+        cache.set('b', (1, data, None))
+        self.assertEqual(cache.get('a'), None)
+
+    def test_expired_entries_are_reclaimed_incrementally(self):
+        now = [1000]
+        cache = BaseCacheBackend(100, expire_batch=2, clock=lambda: now[0])
+        cache.set_many(dict(('old%s' % i, i) for i in range(5)), 10)
+        cache.set('new', 'value', 50)
+        now[0] += 20
+        cache.get('new')
+        self.assertEqual(len(cache.store), 4)
+        cache.get('new')
+        cache.get('new')
+        self.assertEqual(list(cache.store.keys()), ['new'])
+        self.assertEqual(cache.expirations, 5)
+        # Keys set again are not expired with their former timeout
+        cache.set('new', 'again', 100)
+        now[0] += 40
+        self.assertEqual(cache.purge_expired(), 0)
+        self.assertEqual(cache.get('new'), 'again')
+
+    def test_sub_second_timeouts(self):
+        cache = BaseCacheBackend(100)
+        cache.set('key', 'value', 0.2)
+        self.assertEqual(cache.get('key'), 'value')
+        time.sleep(0.3)
+        self.assertEqual(cache.get('key'), None)
+
+    def test_now_timestamp_is_utc(self):
+        self.assertAlmostEqual(pussycache.cache.get_now_timestamp(),
+                               time.time(), delta=1)
+
+    def test_expiry_index_does_not_grow_with_updates(self):
+        cache = BaseCacheBackend(100)
+        for i in range(1000):
+            cache.set('key', i)
+        self.assertTrue(len(cache._expiries) < 100)
+
+    def test_one_call_handles_a_bounded_number_of_expiries(self):
+        now = [1000]
+        cache = BaseCacheBackend(100, expire_batch=10, clock=lambda: now[0])
+        cache.set_many(dict(('key%s' % i, i) for i in range(10000)), 10)
+        cache.delete_many(['key%s' % i for i in range(10000)])
+        now[0] += 20
+        cache.get('key')
+        self.assertEqual(len(cache._expiries), 10000 - 10)
+        # The heap of the deleted keys is compacted a few entries at a time
+        cache.set('key', 'value')
+        former = len(cache._former_expiries)
+        self.assertEqual(former, 10000 - 10 + 1 - 10)
+        cache.set('key', 'value')
+        self.assertEqual(len(cache._former_expiries),
+                         former - pussycache.cache.COMPACT_BATCH - 10)
+        self.assertEqual(cache.purge_expired(), 0)
+        self.assertEqual(cache.get('key'), 'value')
+
+    def test_sweeper(self):
+        cache = BaseCacheBackend(100, sweep_interval=0.1)
+        try:
+            cache.set('key', 'value', 1)
+            time.sleep(1.5)
+            self.assertEqual(len(cache.store), 0)
+            self.assertEqual(cache.expirations, 1)
+        finally:
+            cache.stop_sweeper()
@@ -0,0 +1,99 @@
+import random
+import threading
+from unittest import TestCase
+
+from pussycache.cache.concurrent_backend import ConcurrentCacheBackend
+from pussycache.proxy import BaseProxy
+
+
+class Counter(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def square(self, value):
+        with self.lock:
+            self.calls += 1
+        return value * value
+
+
+class TestConcurrentCacheBackend(TestCase):
+    """Stress tests, with threads hammering the same keys"""
+
+    threads = 16
+    operations = 2000
+
+    def run_threads(self, target):
+        errors = []
+
+        def run(number):
+            try:
+                target(number)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i,))
+                   for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_stress(self):
+        cache = ConcurrentCacheBackend(100, shards=4, max_entries=200,
+                                       max_size=100000)
+
+        def hammer(number):
+            rand = random.Random(number)
+            for i in range(self.operations):
+                key = "key-%s" % rand.randint(0, 500)
+                operation = rand.random()
+                if operation < 0.4:
+                    value = cache.get(key)
+                    assert value is None or value[0] == key
+                elif operation < 0.7:
+                    cache.set(key, (key, number))
+                elif operation < 0.8:
+                    cache.add(key, (key, number))
+                elif operation < 0.9:
+                    cache.delete(key)
+                elif operation < 0.95:
+                    cache.set_many(dict(("key-%s" % j, ("key-%s" % j, i))
+                                        for j in range(i % 500, i % 500 + 5)))
+                else:
+                    cache.clear()
+
+        self.run_threads(hammer)
+        for shard in cache.shards:
+            self.assertTrue(len(shard.store) <= shard.max_entries)
+            self.assertEqual(shard.size,
+                             sum(entry["size"]
+                                 for entry in shard.store.values()))
+        self.assertTrue(len(cache) <= 200)
+
+    def test_add_is_atomic(self):
+        cache = ConcurrentCacheBackend(100, shards=4)
+        winners = []
+
+        def add(number):
+            for i in range(200):
+                if cache.add("slot-%s" % i, number):
+                    winners.append(i)
+
+        self.run_threads(add)
+        self.assertEqual(sorted(winners), list(range(200)))
+
+    def test_single_flight_proxy(self):
+        counter = Counter()
+        proxy = BaseProxy(counter, cache=ConcurrentCacheBackend(100),
+                          cached_methods={"square": {"single_flight": True}},
+                          invalidate_methods={})
+
+        def call(number):
+            for i in range(self.operations // 10):
+                assert proxy.square(i % 50) == (i % 50) ** 2
+
+        self.run_threads(call)
+        self.assertEqual(counter.calls, 50)
@@ -0,0 +1,77 @@
+from unittest import TestCase, SkipTest
+
+from pussycache.proxy import BaseProxy
+
+try:
+    from pussycache.cache.django_backend import DjangoCacheBackend
+except ImportError:
+    DjangoCacheBackend = None
+
+
+class Example(object):
+
+    def __init__(self):
+        self.users = ["Adam", "Bob", "Peter"]
+
+    def get_users(self):
+        return self.users
+
+    def delete_user(self, user):
+        self.users = [usr for usr in self.users if usr != user]
+        return self.users
+
+
+def setUpModule():
+    if DjangoCacheBackend is None:
+        raise SkipTest("django is not installed")
+    from django.conf import settings
+    if not settings.configured:
+        settings.configure(CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "pussycache-tests",
+            },
+        })
+
+
+class TestDjangoCacheBackend(TestCase):
+
+    def setUp(self):
+        from django.core.cache import caches
+        self.django_cache = caches["default"]
+        self.django_cache.clear()
+        self.cache = DjangoCacheBackend(alias="default")
+
+    def test_shares_the_django_cache(self):
+        self.cache.set("key", "value")
+        self.assertEqual(self.django_cache.get("key"), "value")
+        self.django_cache.set("other", "value")
+        self.assertEqual(self.cache.get_many(["key", "other", "missing"]),
+                         {"key": "value", "other": "value"})
+
+    def test_default_timeout(self):
+        self.assertEqual(self.cache.timeout, self.django_cache.default_timeout)
+        self.assertEqual(DjangoCacheBackend(10, alias="default").timeout, 10)
+
+    def test_add(self):
+        self.assertTrue(self.cache.add("key", "value"))
+        self.assertFalse(self.cache.add("key", "other"))
+        self.assertEqual(self.cache.get("key"), "value")
+
+    def test_several_instances(self):
+        first = DjangoCacheBackend(
+            100, "django.core.cache.backends.locmem.LocMemCache", "first")
+        second = DjangoCacheBackend(
+            100, "django.core.cache.backends.locmem.LocMemCache", "second")
+        first.set("key", "first")
+        self.assertEqual(second.get("key"), None)
+
+    def test_proxy(self):
+        proxy = BaseProxy(Example(), cache=self.cache,
+                          cached_methods=["get_users"],
+                          invalidate_methods={"delete_user": ["get_users"]})
+        self.assertEqual(proxy.get_users(), ["Adam", "Bob", "Peter"])
+        proxy._proxied.users = []
+        self.assertEqual(proxy.get_users(), ["Adam", "Bob", "Peter"])
+        proxy.delete_user("Bob")
+        self.assertEqual(proxy.get_users(), [])
@@ -0,0 +1,113 @@
+import time
+from unittest import TestCase, SkipTest
+
+from pussycache.proxy import BaseProxy
+
+try:
+    from pussycache.cache.redis_backend import RedisCacheBackend
+    from pussycache.cache.layered_backend import LayeredCacheBackend, \
+        LOCAL_TIMEOUT
+except ImportError:
+    RedisCacheBackend = None
+
+
+class Example(object):
+
+    def __init__(self):
+        self.users = ["Adam", "Bob", "Peter"]
+
+    def get_users(self):
+        return self.users
+
+    def delete_user(self, user):
+        self.users = [usr for usr in self.users if usr != user]
+        return self.users
+
+
+def setUpModule():
+    if RedisCacheBackend is None:
+        raise SkipTest("redis is not installed")
+    try:
+        RedisCacheBackend(100).clear()
+    except Exception:
+        raise SkipTest("redis-server is not running")
+
+
+class TestLayeredCacheBackend(TestCase):
+    """Needs a redis-server listening on localhost:6379"""
+
+    def setUp(self):
+        self.workers = [LayeredCacheBackend(RedisCacheBackend(100))
+                        for i in range(2)]
+        time.sleep(0.1)  # let them subscribe
+
+    def tearDown(self):
+        for worker in self.workers:
+            worker.clear()
+            worker.close()
+
+    def wait_for_invalidation(self):
+        time.sleep(0.5)
+
+    def test_fills_local_tier(self):
+        first, second = self.workers
+        first.set('key', 'value')
+        self.wait_for_invalidation()
+        self.assertEqual(second.local.get('key'), None)
+        self.assertEqual(second.get('key'), 'value')
+        self.assertEqual(second.local.get('key'), 'value')
+
+    def test_local_values_expire_with_the_remote_ones(self):
+        first, second = self.workers
+        self.assertEqual(first.local_timeout, LOCAL_TIMEOUT)
+        first.set('key', 'value', 1)
+        self.wait_for_invalidation()
+        self.assertEqual(second.get('key'), 'value')
+        self.assertEqual(second.local.get('key'), 'value')
+        time.sleep(0.6)
+        self.assertEqual(second.local.get('key'), None)
+        self.assertEqual(second.get('key'), None)
+
+    def test_value_invalidated_while_read_is_not_kept(self):
+        first, second = self.workers
+        first.set('key', 'value')
+        self.wait_for_invalidation()
+        read = second.remote.get_many_with_ttl
+
+        def racing_read(keys):
+            found = read(keys)
+            first.delete('key')
+            self.wait_for_invalidation()
+            return found
+        second.remote.get_many_with_ttl = racing_read
+        self.assertEqual(second.get('key'), 'value')
+        self.assertEqual(second.local.get('key'), None)
+
+    def test_delete_is_broadcast(self):
+        first, second = self.workers
+        first.set('key', 'value')
+        second.get('key')
+        first.delete('key')
+        self.wait_for_invalidation()
+        self.assertEqual(second.local.get('key'), None)
+        self.assertEqual(second.get('key'), None)
+
+    def test_set_is_broadcast(self):
+        first, second = self.workers
+        first.set('key', 'value')
+        second.get('key')
+        first.set('key', 'new value')
+        self.wait_for_invalidation()
+        self.assertEqual(second.get('key'), 'new value')
+
+    def test_invalidator_is_broadcast(self):
+        origin = Example()
+        proxies = [BaseProxy(origin, cache=worker,
+                             cached_methods=["get_users"],
+                             invalidate_methods={
+                                 "delete_user": ["get_users"]})
+                   for worker in self.workers]
+        self.assertEqual(proxies[1].get_users(), ["Adam", "Bob", "Peter"])
+        proxies[0].delete_user("Bob")
+        self.wait_for_invalidation()
+        self.assertEqual(proxies[1].get_users(), ["Adam", "Peter"])
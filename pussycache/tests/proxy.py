@@ -1,8 +1,13 @@
+import threading
+import time
 from collections import OrderedDict
 from unittest import TestCase
 
-from pussycache.proxy import BaseProxy
+from pussycache.proxy import BaseProxy, proxies_prometheus, proxy_class
 from pussycache.cache import BaseCacheBackend
+from pussycache.keys import cache_key_args
+from pussycache.refresh import RefreshExecutor
+from pussycache.stats import READ_SAMPLING
 
 
 class Example(object):
@@ -30,6 +35,69 @@ class Example(object):
                 if key in self.users}
 
 
+class SlowExample(object):
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_value(self, value):
+        self.calls += 1
+        time.sleep(0.2)
+        return value
+
+
+class Counter(object):
+
+    def __init__(self):
+        self.value = 0
+
+    def next_value(self):
+        self.value += 1
+        return self.value
+
+
+class Server(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+
+    def __cache_key__(self):
+        return self.name
+
+    def get_name(self, unused=None):
+        self.calls += 1
+        return self.name
+
+    @cache_key_args("user")
+    def get_user(self, user, request_id=None):
+        self.calls += 1
+        return user
+
+
+class Accounts(object):
+
+    def __init__(self):
+        self.balances = {"Bob": 1}
+
+    def get_balance(self, user, currency="EUR"):
+        return self.balances[user]
+
+    def set_balance(self, user, balance):
+        self.balances[user] = balance
+        return balance
+
+
+class NeverLockedCacheBackend(BaseCacheBackend):
+    """A cache backend whose lock is always held by another process"""
+
+    def lock(self, key, timeout, blocking_timeout=None):
+        return self
+
+    def acquire(self):
+        return False
+
+
 class TestProxy(TestCase):
 
     def setUp(self):
@@ -50,15 +118,38 @@ class TestProxy(TestCase):
     def test_in_the_cache(self):
 
         users = self.proxy.get_users()
-        self.assertEqual(users, self.proxy._cache.get("get_users()[]"))
+        key = "pussycache.tests.proxy.Example:get_users(){}"
+        self.assertEqual(users, self.proxy._cache.get(key)[1])
         self.proxy.get_user_with_kwargs(user="Bob")
-        self.assertEqual(
-            "Bob",
-            self.proxy._cache.get("get_user_with_kwargs()[('user', 'Bob')]"))
+        key = ("pussycache.tests.proxy.Example:"
+               "get_user_with_kwargs(){'user':'Bob'}")
+        self.assertEqual("Bob", self.proxy._cache.get(key)[1])
         self.assertEqual(["Adam", "Peter"], self.proxy.delete_user("Bob"))
-        self.assertEqual(
-            None,
-            self.proxy._cache.get("get_user_with_kwargs()[('user', 'Bob')]"))
+        self.assertEqual(["Adam", "Peter"], self.proxy.get_users())
+
+    def test_hit_costs_one_backend_read(self):
+        self.proxy.get_users()
+        cache = self.proxy._cache
+        calls = []
+
+        def record(name):
+            method = getattr(cache, name)
+
+            def recorded(*args, **kwargs):
+                calls.append(name)
+                return method(*args, **kwargs)
+            setattr(cache, name, recorded)
+
+        for name in ("get", "get_many", "set", "set_many"):
+            record(name)
+        self.proxy.get_users()
+        self.assertEqual(calls, ["get_many"])
+
+        # Invalidation is a single write before the method and one after,
+        # whatever the number of keys
+        del calls[:]
+        self.proxy.delete_user("Bob")
+        self.assertEqual(calls, ["set_many", "set_many"])
 
     def test_sorted_kwargs(self):
         # First call
@@ -81,3 +172,629 @@ class TestProxy(TestCase):
 
         # Check that second call does not create another key
         self.assertEqual(len(self.proxy._cache.store.keys()), count)
+
+    def test_falsy_results_are_cached(self):
+        proxied = SlowExample()
+        proxy = BaseProxy(proxied, cache=BaseCacheBackend(300),
+                          cached_methods=["get_value"],
+                          invalidate_methods={})
+        for value in (None, 0, [], False):
+            self.assertEqual(proxy.get_value(value), value)
+            self.assertEqual(proxy.get_value(value), value)
+        self.assertEqual(proxied.calls, 4)
+
+    def test_negative_timeout(self):
+        cache = BaseCacheBackend(300)
+        proxy = BaseProxy(SlowExample(), cache=cache,
+                          cached_methods={"get_value": {
+                              "negative_timeout": 10}},
+                          invalidate_methods={})
+        proxy.get_value(None)
+        proxy.get_value("value")
+        timeouts = dict((key.split(":", 1)[-1], entry["timeout"])
+                        for key, entry in cache.store.items())
+        self.assertAlmostEqual(timeouts["get_value(){'value':'value'}"] -
+                               timeouts["get_value(){'value':None}"], 290,
+                               delta=1)
+
+    def test_results_cached_during_an_invalidation_are_invalidated(self):
+        class Balances(Accounts):
+            def set_balance(self, user, balance):
+                # A concurrent read lands before the change is made
+                self.reads.append(proxy.get_balance(user))
+                return Accounts.set_balance(self, user, balance)
+
+        proxied = Balances()
+        proxied.reads = []
+        proxy = BaseProxy(proxied, cache=BaseCacheBackend(300),
+                          cached_methods=["get_balance"],
+                          invalidate_methods={"set_balance": [
+                              "get_balance"]})
+        proxy.set_balance("Bob", 2)
+        self.assertEqual(proxied.reads, [1])
+        self.assertEqual(proxy.get_balance("Bob"), 2)
+
+        proxy = BaseProxy(proxied, cache=BaseCacheBackend(300),
+                          cached_methods=["get_balance"],
+                          invalidate_methods={"set_balance": [
+                              {"method": "get_balance",
+                               "kwargs": {"user": "user"}}]})
+        proxy.set_balance("Bob", 3)
+        self.assertEqual(proxy.get_balance("Bob"), 3)
+
+    def test_first_fill_does_not_replace_a_new_generation(self):
+        cache = BaseCacheBackend(300)
+
+        class Racing(Counter):
+            def next_value(self):
+                # An invalidation lands while the result is computed
+                cache.set(generation_key, "new", 300)
+                return Counter.next_value(self)
+
+        proxy = BaseProxy(Racing(), cache=cache,
+                          cached_methods=["next_value"],
+                          invalidate_methods={})
+        generation_key = proxy._key_builder.generation_key("next_value")
+        self.assertEqual(proxy.next_value(), 1)
+        self.assertEqual(cache.get(generation_key), "new")
+        self.assertEqual(proxy.next_value(), 2)
+        self.assertEqual(proxy.next_value(), 2)
+
+
+class TestPolicies(TestCase):
+
+    def setUp(self):
+        self.proxied = Server("server")
+        self.cache = BaseCacheBackend(300)
+
+    def timeouts(self):
+        now = self.cache.clock()
+        return [entry["timeout"] - now
+                for key, entry in self.cache.store.items()
+                if not key.startswith("pussycache:generation:")]
+
+    def test_timeout(self):
+        proxy = BaseProxy(self.proxied, cache=self.cache,
+                          cached_methods={"get_name": {"timeout": 10}},
+                          invalidate_methods={})
+        proxy.get_name()
+        self.assertAlmostEqual(self.timeouts()[0], 10, delta=1)
+
+    def test_jitter(self):
+        proxy = BaseProxy(self.proxied, cache=self.cache,
+                          cached_methods={"get_name": {"timeout": 100,
+                                                       "jitter": 0.2}},
+                          invalidate_methods={})
+        for i in range(50):
+            proxy.get_name(i)
+        timeouts = self.timeouts()
+        self.assertTrue(min(timeouts) >= 79)
+        self.assertTrue(max(timeouts) <= 100)
+        self.assertTrue(len(set(int(t) for t in timeouts)) > 1)
+
+    def test_jitter_of_sub_second_timeouts(self):
+        proxy = BaseProxy(self.proxied, cache=self.cache,
+                          cached_methods={"get_name": {"timeout": 0.5,
+                                                       "jitter": 0.2}},
+                          invalidate_methods={})
+        for i in range(50):
+            proxy.get_name(i)
+        timeouts = self.timeouts()
+        self.assertTrue(min(timeouts) >= 0.39)
+        self.assertTrue(max(timeouts) <= 0.5)
+        self.assertTrue(len(set(timeouts)) > 1)
+
+    def test_max_entries(self):
+        proxy = BaseProxy(self.proxied, cache=self.cache,
+                          cached_methods={"get_name": {"max_entries": 2}},
+                          invalidate_methods={})
+        proxy.get_name(1)
+        proxy.get_name(2)
+        proxy.get_name(1)
+        proxy.get_name(3)
+        self.assertEqual(len(self.timeouts()), 2)
+        proxy.get_name(1)
+        self.assertEqual(self.proxied.calls, 3)
+        proxy.get_name(2)
+        self.assertEqual(self.proxied.calls, 4)
+
+
+class TestProxyClass(TestCase):
+
+    def setUp(self):
+        self.cache = BaseCacheBackend(300)
+        self.Proxy = proxy_class(
+            Example, ["get_users"], {"delete_user": ["get_users"]})
+
+    def test_made_once_per_configuration(self):
+        self.assertIs(self.Proxy, proxy_class(
+            Example, ["get_users"], {"delete_user": ["get_users"]}))
+        self.assertIsNot(self.Proxy, proxy_class(
+            Example, {"get_users": {"timeout": 10}},
+            {"delete_user": ["get_users"]}))
+
+    def test_cache_and_invalidation(self):
+        proxied = Example()
+        proxy = self.Proxy(proxied, self.cache)
+        self.assertEqual(proxy.get_users(), ["Adam", "Bob", "Peter"])
+        proxied.users = []
+        self.assertEqual(proxy.get_users(), ["Adam", "Bob", "Peter"])
+        # Proxies of the same class share the cache keys
+        other = self.Proxy(Example(), self.cache)
+        self.assertEqual(other.get_users(), ["Adam", "Bob", "Peter"])
+        proxy.delete_user("Bob")
+        self.assertEqual(proxy.get_users(), [])
+        self.assertEqual(proxy.stats()["get_users"]["misses"], 2)
+
+    def test_forwarding(self):
+        proxied = Example()
+        proxy = self.Proxy(proxied, self.cache)
+        self.assertEqual(proxy.get_user_with_kwargs(user="Bob"), "Bob")
+        self.assertIn("get_user_with_kwargs", vars(proxy))
+        self.assertEqual(proxy.users, proxied.users)
+
+    def test_cache_key_namespace(self):
+        Proxy = proxy_class(Server, ["get_name"])
+        first = Proxy(Server("first"), self.cache)
+        second = Proxy(Server("second"), self.cache)
+        self.assertEqual(first.get_name(), "first")
+        self.assertEqual(second.get_name(), "second")
+
+    def test_proxies_share_the_wrappers(self):
+        first = self.Proxy(Example(), self.cache)
+        second = self.Proxy(Example(), self.cache)
+        self.assertIs(first.get_users.__func__, second.get_users.__func__)
+        self.assertIs(first.delete_user.__func__,
+                      second.delete_user.__func__)
+        other = self.Proxy(Example(), BaseCacheBackend(300))
+        self.assertIsNot(other.get_users.__func__, first.get_users.__func__)
+
+    def test_max_entries_of_all_the_proxies(self):
+        Proxy = proxy_class(Accounts, {"get_balance": {"max_entries": 1}})
+        first = Proxy(Accounts(), self.cache)
+        second = Proxy(Accounts(), self.cache)
+        first.get_balance("Bob", "EUR")
+        second.get_balance("Bob", "USD")
+        keys = [key for key in self.cache.store if "get_balance(" in key]
+        self.assertEqual(len(keys), 1)
+
+    def test_rules_of_the_proxied_class(self):
+        Proxy = proxy_class(Accounts, ["get_balance"], {"set_balance": [
+            {"method": "get_balance", "kwargs": {"user": "user"}}]})
+        proxied = Accounts()
+        proxy = Proxy(proxied, self.cache)
+        self.assertEqual(proxy.get_balance("Bob"), 1)
+        proxy.set_balance("Bob", 2)
+        self.assertEqual(proxy.get_balance(user="Bob"), 2)
+
+
+class TestScopedInvalidation(TestCase):
+
+    def setUp(self):
+        self.server = Server("server")
+        self.proxy = BaseProxy(
+            self.server, cache=BaseCacheBackend(300),
+            cached_methods=["get_user"],
+            invalidate_methods={"get_name": [
+                {"method": "get_user", "kwargs": {"user": "unused"}},
+                {"method": "get_user",
+                 "kwargs": {"user": lambda args: args["unused"].upper()}},
+            ]})
+
+    def test_only_the_given_calls_are_invalidated(self):
+        for user in ("Adam", "Bob", "BOB"):
+            self.proxy.get_user(user)
+        self.assertEqual(self.server.calls, 3)
+        self.proxy.get_name(unused="Bob")  # counts as a call too
+        self.assertEqual(self.server.calls, 4)
+        self.proxy.get_user("Adam")
+        self.assertEqual(self.server.calls, 4)
+        self.proxy.get_user("Bob")
+        self.proxy.get_user("BOB")
+        self.assertEqual(self.server.calls, 6)
+        stats = self.proxy.stats()["get_name"]
+        self.assertEqual(stats["invalidated_keys"], 2)
+        self.assertEqual(stats["invalidated_methods"], 0)
+
+    def test_keys_of_the_rules_are_the_ones_of_the_calls(self):
+        proxied = Accounts()
+        proxy = BaseProxy(proxied, cache=BaseCacheBackend(300),
+                          cached_methods=["get_balance"],
+                          invalidate_methods={"set_balance": [
+                              {"method": "get_balance",
+                               "kwargs": {"user": "user"}}]})
+        self.assertEqual(proxy.get_balance("Bob"), 1)
+        self.assertEqual(proxy.get_balance(user="Bob", currency="EUR"), 1)
+        proxy.set_balance("Bob", 2)
+        self.assertEqual(proxy.get_balance("Bob"), 2)
+        self.assertEqual(proxy.get_balance(user="Bob", currency="EUR"), 2)
+
+    def test_rules_use_the_key_args_option(self):
+        proxied = Accounts()
+        proxy = BaseProxy(proxied, cache=BaseCacheBackend(300),
+                          cached_methods={"get_balance": {
+                              "key_args": ["user"]}},
+                          invalidate_methods={"set_balance": [
+                              {"method": "get_balance",
+                               "kwargs": {"user": "user"}, "write": True}]})
+        self.assertEqual(proxy.get_balance("Bob", "USD"), 1)
+        proxy.set_balance("Bob", 2)
+        proxied.balances["Bob"] = 3
+        self.assertEqual(proxy.get_balance("Bob", "USD"), 2)
+
+    def test_rules_use_arguments_of_the_method(self):
+        with self.assertRaises(ValueError) as context:
+            BaseProxy(Accounts(), cache=BaseCacheBackend(300),
+                      cached_methods=["get_balance"],
+                      invalidate_methods={"set_balance": [
+                          {"method": "get_balance",
+                           "kwargs": {"user": "name"}}]})
+        self.assertIn("'name'", str(context.exception))
+
+    def test_rules_need_a_method(self):
+        self.assertRaises(ValueError, BaseProxy, Server("server"),
+                          cache=BaseCacheBackend(300),
+                          cached_methods=["get_user"],
+                          invalidate_methods={"get_name": [
+                              {"kwargs": {"user": "unused"}}]})
+
+
+class TestWriteThrough(TestCase):
+
+    def setUp(self):
+        self.proxied = Example()
+        self.proxy = BaseProxy(
+            self.proxied, cache=BaseCacheBackend(300),
+            cached_methods=["get_users", "get_user_with_kwargs"],
+            invalidate_methods={"delete_user": [
+                {"method": "get_users", "write": True},
+                {"method": "get_user_with_kwargs", "kwargs": {"user": "user"},
+                 "write": lambda users: None},
+            ]})
+
+    def test_result_is_written(self):
+        self.proxy.get_users()
+        self.assertEqual(self.proxy.delete_user("Bob"), ["Adam", "Peter"])
+        self.proxied.users = []
+        self.assertEqual(self.proxy.get_users(), ["Adam", "Peter"])
+        self.assertEqual(self.proxy.get_user_with_kwargs(user="Bob"), None)
+        self.assertEqual(self.proxy.stats()["get_users"]["misses"], 1)
+
+    def test_written_before_any_read(self):
+        self.proxy.delete_user("Bob")
+        self.proxied.users = []
+        self.assertEqual(self.proxy.get_users(), ["Adam", "Peter"])
+
+    def test_written_after_a_method_invalidation(self):
+        proxy = BaseProxy(
+            self.proxied, cache=BaseCacheBackend(300),
+            cached_methods=["get_users", "get_user_with_kwargs"],
+            invalidate_methods={"delete_user": [
+                "get_users", {"method": "get_users", "write": True}]})
+        proxy.get_users()
+        proxy.delete_user("Bob")
+        self.proxied.users = []
+        self.assertEqual(proxy.get_users(), ["Adam", "Peter"])
+
+
+class TestKeys(TestCase):
+
+    def test_proxies_do_not_share_results(self):
+        cache = BaseCacheBackend(300)
+        first, second = [BaseProxy(Server(name), cache=cache,
+                                   cached_methods=["get_name"],
+                                   invalidate_methods={})
+                         for name in ("first", "second")]
+        self.assertEqual(first.get_name(), "first")
+        self.assertEqual(second.get_name(), "second")
+        first = BaseProxy(Server("first"), cache=cache,
+                          cached_methods=["get_name"],
+                          invalidate_methods={})
+        self.assertEqual(first.get_name(), "first")
+        self.assertEqual(first._proxied.calls, 0)
+
+    def test_key_args(self):
+        proxy = BaseProxy(Server("server"), cache=BaseCacheBackend(300),
+                          cached_methods=["get_user"],
+                          invalidate_methods={})
+        self.assertEqual(proxy.get_user("Bob", request_id=1), "Bob")
+        self.assertEqual(proxy.get_user(user="Bob", request_id=2), "Bob")
+        self.assertEqual(proxy.get_user("Adam"), "Adam")
+        self.assertEqual(proxy._proxied.calls, 2)
+
+    def test_calls_share_a_key_whatever_their_form(self):
+        proxied = Server("server")
+        proxy = BaseProxy(proxied, cache=BaseCacheBackend(300),
+                          cached_methods=["get_name"],
+                          invalidate_methods={})
+        proxy.get_name()
+        proxy.get_name(None)
+        proxy.get_name(unused=None)
+        self.assertEqual(proxied.calls, 1)
+        # A call not matching the signature is left to the method
+        self.assertRaises(TypeError, proxy.get_name, 1, 2)
+
+    def test_key_args_must_be_arguments(self):
+        with self.assertRaises(ValueError) as context:
+            BaseProxy(Accounts(), cache=BaseCacheBackend(300),
+                      cached_methods={"get_balance": {
+                          "key_args": ["usr"]}},
+                      invalidate_methods={})
+        self.assertIn("'usr'", str(context.exception))
+
+    def test_uncacheable_arguments(self):
+        proxy = BaseProxy(Server("server"), cache=BaseCacheBackend(300),
+                          cached_methods=["get_name"],
+                          invalidate_methods={})
+        proxy.get_name(object())
+        proxy.get_name(object())
+        self.assertEqual(proxy._proxied.calls, 2)
+        self.assertEqual(len(proxy._cache.store), 0)
+
+
+class TestSingleFlight(TestCase):
+
+    def call_concurrently(self, proxy, count=10):
+        results = []
+        threads = [threading.Thread(
+                   target=lambda: results.append(proxy.get_value(42)))
+                   for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_single_flight(self):
+        proxied = SlowExample()
+        proxy = BaseProxy(proxied, cache=BaseCacheBackend(300),
+                          cached_methods={"get_value": {
+                              "single_flight": True}},
+                          invalidate_methods={})
+        self.assertEqual(self.call_concurrently(proxy), [42] * 10)
+        self.assertEqual(proxied.calls, 1)
+
+    def test_without_single_flight(self):
+        proxied = SlowExample()
+        proxy = BaseProxy(proxied, cache=BaseCacheBackend(300),
+                          cached_methods=["get_value"],
+                          invalidate_methods={})
+        self.assertEqual(self.call_concurrently(proxy), [42] * 10)
+        self.assertEqual(proxied.calls, 10)
+
+    def test_lock_waiter_fallback(self):
+        proxied = SlowExample()
+        proxy = BaseProxy(proxied, cache=NeverLockedCacheBackend(300),
+                          cached_methods={"get_value": {"single_flight": True,
+                                                        "lock_timeout": 1}},
+                          invalidate_methods={})
+        self.assertEqual(proxy.get_value(42), 42)
+        self.assertEqual(proxy.get_value(42), 42)
+        self.assertEqual(proxied.calls, 1)
+
+
+class TestRefresh(TestCase):
+
+    def setUp(self):
+        self.executor = RefreshExecutor()
+
+    def test_stale_while_revalidate(self):
+        proxy = BaseProxy(Counter(), cache=BaseCacheBackend(300),
+                          cached_methods={"next_value": {
+                              "soft_timeout": 0.1,
+                              "refresh_executor": self.executor}},
+                          invalidate_methods={})
+        self.assertEqual(proxy.next_value(), 1)
+        self.assertEqual(proxy.next_value(), 1)
+        time.sleep(0.2)
+        # The stale value is returned while it gets refreshed
+        self.assertEqual(proxy.next_value(), 1)
+        self.executor.join()
+        self.assertEqual(proxy.next_value(), 2)
+
+    def test_refresh_ahead(self):
+        proxy = BaseProxy(Counter(), cache=BaseCacheBackend(300),
+                          cached_methods={"next_value": {
+                              "refresh_ahead": 299.9,
+                              "refresh_executor": self.executor}},
+                          invalidate_methods={})
+        self.assertEqual(proxy.next_value(), 1)
+        time.sleep(0.2)
+        self.assertEqual(proxy.next_value(), 1)
+        self.executor.join()
+        self.assertEqual(proxy.next_value(), 2)
+
+    def test_executor_refreshes_a_key_once_at_a_time(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow():
+            started.set()
+            release.wait()
+
+        self.assertTrue(self.executor.submit("key", slow))
+        started.wait()
+        self.assertFalse(self.executor.submit("key", slow))
+        release.set()
+        self.executor.join()
+        self.assertTrue(self.executor.submit("key", lambda: None))
+        self.executor.join()
+
+
+class TestStats(TestCase):
+
+    def setUp(self):
+        self.proxy = BaseProxy(
+            Example(), cache=BaseCacheBackend(300),
+            cached_methods=["get_users", "get_user_with_kwargs"],
+            invalidate_methods={"delete_user": ["get_users",
+                                                "get_user_with_kwargs"]},
+            namespace="example")
+
+    def test_counters(self):
+        self.proxy.get_users()
+        self.proxy.get_users()
+        self.proxy.get_users()
+        self.proxy.delete_user("Bob")
+        self.proxy.get_users()
+        stats = self.proxy.stats()
+        self.assertEqual(stats["get_users"]["hits"], 2)
+        self.assertEqual(stats["get_users"]["misses"], 2)
+        self.assertEqual(stats["get_users"]["origin"]["count"], 2)
+        self.assertEqual(stats["get_users"]["cache_set"]["count"], 2)
+        self.assertEqual(stats["get_users"]["cache_get"]["count"], 1)
+        self.assertEqual(stats["delete_user"]["invalidations"], 1)
+        self.assertEqual(stats["delete_user"]["invalidated_methods"], 2)
+
+    def test_prometheus(self):
+        self.proxy.get_users()
+        text = self.proxy.stats_prometheus()
+        self.assertIn('pussycache_misses_total{namespace="example",'
+                      'method="get_users"} 1\n', text)
+        self.assertIn('pussycache_origin_seconds_count{namespace="example",'
+                      'method="get_users"} 1\n', text)
+        self.assertIn("# TYPE pussycache_cache_set_seconds histogram", text)
+
+    def test_reads_are_sampled(self):
+        for i in range(READ_SAMPLING * 2 + 1):
+            self.proxy.get_users()
+        stats = self.proxy.stats()["get_users"]
+        self.assertEqual(stats["hits"], READ_SAMPLING * 2)
+        self.assertEqual(stats["cache_get"]["count"], 3)
+
+    def test_prometheus_of_several_proxies(self):
+        other = BaseProxy(Example(), cache=BaseCacheBackend(300),
+                          cached_methods=["get_users"],
+                          invalidate_methods={}, namespace="other")
+        not_instrumented = BaseProxy(Example(), cache=BaseCacheBackend(300),
+                                     cached_methods=["get_users"],
+                                     invalidate_methods={},
+                                     instrument=False)
+        self.proxy.get_users()
+        other.get_users()
+        text = proxies_prometheus(self.proxy, other, not_instrumented)
+        for namespace in ("example", "other"):
+            self.assertIn('pussycache_misses_total{namespace="%s",'
+                          'method="get_users"} 1\n' % namespace, text)
+
+    def test_not_instrumented(self):
+        proxy = BaseProxy(Example(), cache=BaseCacheBackend(300),
+                          cached_methods=["get_users"],
+                          invalidate_methods={}, instrument=False)
+        proxy.get_users()
+        self.assertEqual(proxy.stats(), {})
+
+
+class Users(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def get_users(self, ids, active=True):
+        self.calls.append(list(ids))
+        return dict((user_id, "user %s" % user_id) for user_id in ids
+                    if user_id < 100)
+
+    def get_names(self, prefix, ids):
+        self.calls.append(list(ids))
+        return ["%s %s" % (prefix, user_id) for user_id in ids]
+
+    def delete_user(self, user_id):
+        pass
+
+
+class TestBatch(TestCase):
+
+    def setUp(self):
+        self.users = Users()
+        self.cache = BaseCacheBackend(300)
+        self.proxy = BaseProxy(
+            self.users, cache=self.cache,
+            cached_methods={"get_users": {"batch": True},
+                            "get_names": {"batch": "ids",
+                                          "result": "list"}},
+            invalidate_methods={"delete_user": ["get_users"]})
+
+    def test_only_missing_items_are_fetched(self):
+        self.assertEqual(self.proxy.get_users([1, 2]),
+                         {1: "user 1", 2: "user 2"})
+        self.assertEqual(self.proxy.get_users([2, 3, 1]),
+                         {1: "user 1", 2: "user 2", 3: "user 3"})
+        self.assertEqual(self.proxy.get_users([3, 1]),
+                         {1: "user 1", 3: "user 3"})
+        self.assertEqual(self.users.calls, [[1, 2], [3]])
+
+    def test_one_read_and_one_write(self):
+        self.proxy.get_users([1])
+        calls = []
+
+        def record(name):
+            method = getattr(self.cache, name)
+
+            def recorded(*args, **kwargs):
+                calls.append(name)
+                return method(*args, **kwargs)
+            setattr(self.cache, name, recorded)
+
+        for name in ("get", "get_many", "set", "set_many"):
+            record(name)
+        self.proxy.get_users([1, 2, 3])
+        self.assertEqual(calls, ["get_many", "set_many"])
+
+    def test_items_left_out_are_cached_as_none(self):
+        proxy = BaseProxy(
+            self.users, cache=self.cache,
+            cached_methods={"get_users": {"batch": True,
+                                          "negative_timeout": 10}},
+            invalidate_methods={}, namespace="users")
+        self.assertEqual(proxy.get_users([1, 100]), {1: "user 1"})
+        self.assertEqual(proxy.get_users([1, 100]), {1: "user 1"})
+        self.assertEqual(self.users.calls, [[1, 100]])
+        key = proxy._key_builder.build("get_users", (),
+                                       {"ids": 100, "active": True})
+        self.assertEqual(self.cache.get(key)[1], None)
+        self.assertTrue(self.cache.store[key]["timeout"] <=
+                        self.cache.clock() + 10)
+
+    def test_unhashable_items_are_not_cached(self):
+        self.assertEqual(self.proxy.get_names("Mr", [[1], [2]]),
+                         ["Mr [1]", "Mr [2]"])
+        self.assertEqual(self.proxy.get_names("Mr", [[1], [2]]),
+                         ["Mr [1]", "Mr [2]"])
+        self.assertEqual(self.users.calls, [[[1], [2]], [[1], [2]]])
+
+    def test_items_may_be_an_iterator(self):
+        self.assertEqual(self.proxy.get_users(i for i in [3, 4]),
+                         {3: "user 3", 4: "user 4"})
+        self.assertEqual(self.proxy.get_names("Mr", ids=iter([3, 4])),
+                         ["Mr 3", "Mr 4"])
+        self.assertEqual(self.proxy.get_users(iter([3, 4])),
+                         {3: "user 3", 4: "user 4"})
+        self.assertEqual(self.users.calls, [[3, 4], [3, 4]])
+
+    def test_duplicate_items_are_counted_once(self):
+        self.proxy.get_users([1])
+        self.proxy.get_users([1, 2, 2, 1])
+        stats = self.proxy.stats()["get_users"]
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(self.users.calls, [[1], [2]])
+
+    def test_other_arguments_are_part_of_the_keys(self):
+        self.proxy.get_users([1], active=True)
+        self.proxy.get_users([1], active=False)
+        self.assertEqual(self.users.calls, [[1], [1]])
+
+    def test_list_results(self):
+        self.assertEqual(self.proxy.get_names("Mr", [1, 2]),
+                         ["Mr 1", "Mr 2"])
+        self.assertEqual(self.proxy.get_names("Mr", [2, 3, 2]),
+                         ["Mr 2", "Mr 3", "Mr 2"])
+        self.assertEqual(self.users.calls, [[1, 2], [3]])
+
+    def test_invalidation(self):
+        self.proxy.get_users([1, 2])
+        self.proxy.delete_user(1)
+        self.proxy.get_users([1, 2])
+        self.assertEqual(self.users.calls, [[1, 2], [1, 2]])
+        self.assertEqual(self.proxy.stats()["get_users"]["misses"], 4)
@@ -0,0 +1,105 @@
+import array
+import pickle
+import zlib
+from unittest import TestCase
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pussycache.serializers import (Codec, JSONSerializer, PickleSerializer,
+                                    MsgpackSerializer)
+
+
+class TestCodec(TestCase):
+
+    values = [None, 0, 1.5, [], {"a": [1, 2]}, b"bytes", u"text \xe9"]
+
+    def assertRoundTrip(self, codec, values=None):
+        for value in values or self.values:
+            self.assertEqual(codec.loads(codec.dumps(value)), value)
+
+    def test_pickle(self):
+        self.assertRoundTrip(Codec(PickleSerializer()))
+        self.assertRoundTrip(Codec(), [(1, "a"), set([1])])
+
+    def test_json(self):
+        self.assertRoundTrip(Codec(JSONSerializer()))
+
+    def test_msgpack(self):
+        try:
+            codec = Codec(MsgpackSerializer())
+        except ImportError:
+            self.skipTest("msgpack is not installed")
+        self.assertRoundTrip(codec)
+
+    def test_raw_values_are_not_serialized(self):
+        codec = Codec()
+        self.assertEqual(codec.dumps(b"bytes"), b"rbytes")
+        self.assertEqual(codec.dumps(u"text"), b"ttext")
+
+    def test_memory_views_are_raw_values(self):
+        codec = Codec(compress_threshold=100)
+        self.assertEqual(codec.dumps(memoryview(b"view")), b"rview")
+        words = memoryview(array.array("i", range(100)))
+        self.assertEqual(codec.loads(codec.dumps(words)), words.tobytes())
+        self.assertEqual(codec.loads(codec.dumps(words[::2])),
+                         words[::2].tobytes())
+
+    def test_byte_arrays_keep_their_type(self):
+        codec = Codec()
+        value = bytearray(b"x" * 1000)
+        self.assertEqual(codec.loads(codec.dumps(value)), value)
+        self.assertIsInstance(codec.loads(codec.dumps(value)), bytearray)
+        self.assertIsInstance(codec.loads(codec.dumps([value]))[0],
+                              bytearray)
+
+    def test_compression(self):
+        codec = Codec(compress_threshold=100)
+        big = b"x" * 1000
+        data = codec.dumps(big)
+        self.assertEqual(data[:1], b"R")
+        self.assertEqual(zlib.decompress(data[1:]), big)
+        self.assertEqual(codec.loads(data), big)
+        self.assertEqual(codec.dumps(b"small"), b"rsmall")
+        self.assertRoundTrip(codec, [u"y" * 1000, list(range(1000))])
+
+    def test_legacy_values(self):
+        data = pickle.dumps({"value": [1, 2]}, 2)
+        self.assertEqual(Codec().loads(data), [1, 2])
+
+    def test_out_of_band_buffers(self):
+        if pickle.HIGHEST_PROTOCOL < 5:
+            self.skipTest("pickle protocol 5 is not available")
+        data = b"x" * 1000
+        encoded = Codec().dumps({"data": pickle.PickleBuffer(data)})
+        self.assertEqual(encoded[:1], b"o")
+        # The buffer is not copied into the pickle
+        self.assertEqual(encoded.count(data), 1)
+        loaded = Codec().loads(encoded)["data"]
+        self.assertEqual(loaded.tobytes(), data)
+        self.assertTrue(loaded.obj is encoded)
+        codec = Codec(compress_threshold=100)
+        encoded = codec.dumps([pickle.PickleBuffer(data)])
+        self.assertEqual(encoded[:1], b"O")
+        self.assertEqual(codec.loads(encoded)[0].tobytes(), data)
+        codec = Codec(PickleSerializer(4))
+        encoded = codec.dumps([bytearray(data)])
+        self.assertEqual(encoded[:1], b"s")
+        self.assertEqual(codec.loads(encoded), [bytearray(data)])
+
+    def test_numpy_arrays(self):
+        if numpy is None:
+            self.skipTest("numpy is not installed")
+        array = numpy.arange(100000, dtype="float64")
+        codec = Codec()
+        encoded = codec.dumps({"array": array, "other": [1]})
+        self.assertEqual(encoded[:1], b"o")
+        self.assertTrue(len(encoded) < array.nbytes + 200)
+        loaded = codec.loads(encoded)
+        self.assertTrue((loaded["array"] == array).all())
+        self.assertEqual(loaded["other"], [1])
+        # The array uses the loaded data, it is not copied
+        self.assertFalse(loaded["array"].flags.owndata)
+        self.assertFalse(loaded["array"].flags.writeable)
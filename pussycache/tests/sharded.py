@@ -0,0 +1,144 @@
+import threading
+from unittest import TestCase, SkipTest
+
+try:
+    from pussycache.cache.redis_backend import RedisCacheBackend, \
+        chunk_keys
+    from pussycache.cache.sharded_redis_backend import \
+        ShardedRedisCacheBackend
+except ImportError:
+    RedisCacheBackend = None
+
+NODES = ["redis://localhost:6379/1", "redis://localhost:6379/2",
+         "redis://localhost:6379/3"]
+
+
+def setUpModule():
+    if RedisCacheBackend is None:
+        raise SkipTest("redis is not installed")
+    try:
+        RedisCacheBackend(100).db.ping()
+    except Exception:
+        raise SkipTest("redis-server is not running")
+
+
+class TestShardedRedisCacheBackend(TestCase):
+    """Needs a redis-server listening on localhost:6379, its databases 1
+    to 3 stand for three servers"""
+
+    def setUp(self):
+        self.cache = ShardedRedisCacheBackend(100, NODES[:2])
+        self.cache.clear()
+
+    def tearDown(self):
+        self.cache.clear()
+        self.cache.close()
+
+    def test_keys_are_spread(self):
+        values = dict(("key %s" % i, i) for i in range(100))
+        self.cache.set_many(values)
+        self.assertEqual(self.cache.get_many(values), values)
+        for node in self.cache.nodes.values():
+            self.assertTrue(10 < node.db.dbsize() < 90)
+        self.cache.delete_many(values)
+        self.assertEqual(self.cache.get_many(values), {})
+
+    def test_adding_a_node_moves_few_keys(self):
+        values = dict(("key %s" % i, i) for i in range(300))
+        self.cache.set_many(values)
+        self.cache.add_node(NODES[2])
+        try:
+            found = self.cache.get_many(values)
+            self.assertTrue(150 < len(found) < 270)
+            self.cache.set_many(dict((key, values[key]) for key in values
+                                     if key not in found))
+            self.assertEqual(self.cache.get_many(values), values)
+        finally:
+            self.cache.clear()
+            self.cache.remove_node(NODES[2])
+
+    def test_servers_change_during_operations(self):
+        values = dict(("key %s" % i, i) for i in range(50))
+        errors = []
+        done = threading.Event()
+
+        def work():
+            try:
+                while not done.is_set():
+                    self.cache.set_many(values)
+                    found = self.cache.get_many(values)
+                    for key in found:
+                        self.assertEqual(found[key], values[key])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            for i in range(20):
+                self.cache.add_node(NODES[2])
+                self.cache.remove_node(NODES[2])
+        finally:
+            done.set()
+            for thread in threads:
+                thread.join()
+            self.cache.clear()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(self.cache.nodes), NODES[:2])
+        self.assertEqual(self.cache.get_many(values), {})
+
+    def test_servers_are_replaced_not_changed(self):
+        nodes, ring = self.cache.nodes, self.cache.ring
+        self.cache.add_node(NODES[2])
+        try:
+            self.assertEqual(sorted(nodes), NODES[:2])
+            self.assertEqual(sorted(self.cache.nodes), NODES)
+            self.assertEqual(set(ring.node("key %s" % i)
+                                 for i in range(100)), set(NODES[:2]))
+        finally:
+            self.cache.remove_node(NODES[2])
+
+    def test_pipeline(self):
+        with self.cache.pipeline():
+            self.cache.set_many(dict(("key %s" % i, i) for i in range(10)))
+            self.assertEqual(self.cache.get("key 1"), None)
+        self.assertEqual(self.cache.get("key 1"), 1)
+
+    def test_lock(self):
+        lock = self.cache.lock("key", 10, 0)
+        self.assertTrue(lock.acquire())
+        self.assertFalse(self.cache.lock("key", 10, 0).acquire())
+        lock.release()
+
+    def test_prefixed_clear(self):
+        users = ShardedRedisCacheBackend(100, NODES[:2], prefix="users[1]:")
+        try:
+            users.set_many(dict(("key %s" % i, i) for i in range(2500)))
+            self.cache.set_many({"key 1": "other", "users1:key 1": "other"})
+            self.assertEqual(users.get("key 1"), 1)
+            users.clear()
+            self.assertEqual(users.get_many(["key 1", "key 2499"]), {})
+            self.assertEqual(self.cache.get_many(["key 1", "users1:key 1"]),
+                             {"key 1": "other", "users1:key 1": "other"})
+        finally:
+            users.close()
+
+    def test_chunks(self):
+        cache = ShardedRedisCacheBackend(100, NODES[:2], chunk_size=1000)
+        try:
+            big = b"x" * 2500
+            cache.set_many({"big": big, "small": b"small"})
+            node = cache._node("big")
+            self.assertEqual(node.db.get("big")[:1], b"c")
+            self.assertEqual(len(chunk_keys("big", node.db.get("big"))), 3)
+            self.assertEqual(cache.get_many(["big", "small"]),
+                             {"big": big, "small": b"small"})
+            self.assertFalse(cache.add("big", b"y" * 2500))
+            cache.set("big", b"y" * 2500)
+            self.assertEqual(cache.get("big"), b"y" * 2500)
+            # A value whose chunk expired is missing
+            node.db.delete(chunk_keys("big", node.db.get("big"))[0])
+            self.assertEqual(cache.get("big", "missing"), "missing")
+        finally:
+            cache.close()
@@ -0,0 +1,72 @@
+import multiprocessing
+import uuid
+from unittest import TestCase
+
+from pussycache.cache.shm_backend import SharedMemoryCacheBackend
+
+
+def fill(name, start):
+    cache = SharedMemoryCacheBackend(100, name=name, slots=1024)
+    for i in range(start, start + 50):
+        cache.set("key-%s" % i, {"value": i})
+    cache.close()
+
+
+def claim(name, number, queue):
+    cache = SharedMemoryCacheBackend(100, name=name, slots=1024)
+    queue.put([i for i in range(100) if cache.add("slot-%s" % i, number)])
+    cache.close()
+
+
+class TestSharedMemoryCacheBackend(TestCase):
+
+    def setUp(self):
+        self.name = "test-%s" % uuid.uuid4().hex
+        self.cache = SharedMemoryCacheBackend(100, name=self.name,
+                                              slots=1024)
+
+    def tearDown(self):
+        self.cache.destroy()
+
+    def run_processes(self, target, *args):
+        processes = [multiprocessing.Process(target=target,
+                                             args=(self.name, i) + args)
+                     for i in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+    def test_shared_between_processes(self):
+        self.run_processes(fill)
+        self.assertEqual(self.cache.get("key-0"), {"value": 0})
+        self.assertEqual(len(self.cache.get_many(
+            ["key-%s" % i for i in range(53)])), 53)
+
+    def test_add_is_atomic_between_processes(self):
+        queue = multiprocessing.Queue()
+        self.run_processes(claim, queue)
+        claimed = sum([queue.get() for i in range(4)], [])
+        self.assertEqual(sorted(claimed), list(range(100)))
+
+    def test_full_table_evicts(self):
+        cache = SharedMemoryCacheBackend(100, name=self.name + "-small",
+                                         slots=16, stripes=1)
+        try:
+            for i in range(32):
+                cache.set("key-%s" % i, i, timeout=i + 1)
+            self.assertEqual(cache.evictions, 16)
+            self.assertEqual(cache.get("key-31"), 31)
+            self.assertEqual(cache.get("key-0"), None)
+        finally:
+            cache.destroy()
+
+    def test_values_bigger_than_a_slot_are_not_cached(self):
+        self.cache.set("key", "small")
+        self.cache.set("key", "x" * 2000)
+        self.assertEqual(self.cache.get("key"), None)
+
+    def test_mismatching_layout(self):
+        self.assertRaises(ValueError, SharedMemoryCacheBackend, 100,
+                          name=self.name, slots=2048)
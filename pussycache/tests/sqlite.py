@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from pussycache.cache.sqlite_backend import (PURGE_EVERY,
+                                             SQLiteCacheBackend)
+
+
+class TestSQLiteCacheBackend(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "cache.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_warm_restart(self):
+        cache = SQLiteCacheBackend(100, self.path)
+        cache.set_many(dict(("key-%s" % i, [i]) for i in range(100)))
+        cache.close()
+        cache = SQLiteCacheBackend(100, self.path)
+        self.assertEqual(cache.get("key-42"), [42])
+        self.assertEqual(len(cache.get_many(
+            ["key-%s" % i for i in range(2000)])), 100)
+        cache.close()
+
+    def test_pipeline_is_one_transaction(self):
+        cache = SQLiteCacheBackend(100, self.path)
+        other = SQLiteCacheBackend(100, self.path)
+        with cache.pipeline():
+            cache.set("a", 1)
+            cache.delete_many(["b"])
+            cache.set_many({"c": 3})
+            self.assertEqual(other.get_many(["a", "c"]), {})
+        self.assertEqual(other.get_many(["a", "c"]), {"a": 1, "c": 3})
+        cache.close()
+        other.close()
+
+    def test_pipeline_is_rolled_back_on_error(self):
+        cache = SQLiteCacheBackend(100, self.path)
+        cache.set("a", 1)
+        with self.assertRaises(ValueError):
+            with cache.pipeline():
+                cache.set("a", 2)
+                cache.set("b", 2)
+                raise ValueError()
+        self.assertEqual(cache.get_many(["a", "b"]), {"a": 1})
+        cache.set("c", 3)
+        self.assertEqual(cache.get("c"), 3)
+        cache.close()
+
+    def test_expired_entries_are_purged(self):
+        cache = SQLiteCacheBackend(100, self.path)
+        cache.set_many(dict(("old-%s" % i, i) for i in range(10)),
+                       timeout=0.01)
+        time.sleep(0.02)
+        cache.set_many(dict(("key-%s" % i, i) for i in range(PURGE_EVERY)))
+        count = cache._db.execute(
+            "SELECT COUNT(*) FROM pussycache").fetchone()[0]
+        self.assertEqual(count, PURGE_EVERY)
+        cache.close()
+
+    def test_max_entries(self):
+        cache = SQLiteCacheBackend(100, self.path, max_entries=100)
+        for i in range(500):
+            cache.set("key-%s" % i, i, timeout=i + 1)
+        count = cache._db.execute(
+            "SELECT COUNT(*) FROM pussycache").fetchone()[0]
+        self.assertTrue(count <= 110)
+        self.assertEqual(cache.get("key-499"), 499)
+        self.assertEqual(cache.get("key-0"), None)
+        cache.close()
+
+    def test_threads(self):
+        cache = SQLiteCacheBackend(100, self.path)
+        errors = []
+
+        def write(number):
+            try:
+                for i in range(50):
+                    cache.set("key-%s-%s" % (number, i), i)
+                    cache.get("key-%s-%s" % (number, i))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                cache.close()
+
+        threads = [threading.Thread(target=write, args=(i,))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(cache.get("key-3-49"), 49)
+        cache.close()
@@ -0,0 +1,73 @@
+import time
+from unittest import TestCase
+
+from pussycache.cache import BaseCacheBackend
+from pussycache.cache.write_behind_backend import WriteBehindCacheBackend
+
+
+class RecordingCacheBackend(BaseCacheBackend):
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingCacheBackend, self).__init__(*args, **kwargs)
+        self.batches = []
+
+    def set_many(self, valuesdict, timeout=None):
+        self.batches.append(len(valuesdict))
+        super(RecordingCacheBackend, self).set_many(valuesdict, timeout)
+
+
+class TestWriteBehindCacheBackend(TestCase):
+
+    def setUp(self):
+        self.backend = RecordingCacheBackend(100, thread_safe=True)
+
+    def test_flushed_in_the_background(self):
+        cache = WriteBehindCacheBackend(self.backend, flush_interval=0.05)
+        try:
+            cache.set("key", "value")
+            self.assertEqual(cache.get("key"), "value")
+            time.sleep(0.3)
+            self.assertEqual(self.backend.get("key"), "value")
+        finally:
+            cache.close()
+
+    def test_batches(self):
+        cache = WriteBehindCacheBackend(self.backend, batch_size=10,
+                                        flush_interval=10)
+        try:
+            cache.set_many(dict(("key %s" % i, i) for i in range(25)))
+            cache.flush()
+            self.assertEqual(self.backend.batches, [10, 10, 5])
+        finally:
+            cache.close()
+
+    def test_writes_of_a_key_are_merged(self):
+        cache = WriteBehindCacheBackend(self.backend, flush_interval=10)
+        try:
+            cache.set("key", "value")
+            cache.set("key", "again")
+            cache.flush()
+            self.assertEqual(self.backend.batches, [1])
+            self.assertEqual(self.backend.get("key"), "again")
+        finally:
+            cache.close()
+
+    def test_deleted_keys_are_not_written(self):
+        cache = WriteBehindCacheBackend(self.backend, flush_interval=10)
+        try:
+            cache.set("key", "value")
+            cache.delete("key")
+            cache.flush()
+            self.assertEqual(cache.get("key"), None)
+            self.assertEqual(self.backend.batches, [])
+        finally:
+            cache.close()
+
+    def test_max_pending(self):
+        cache = WriteBehindCacheBackend(self.backend, batch_size=100,
+                                        flush_interval=10, max_pending=5)
+        try:
+            cache.set_many(dict(("key %s" % i, i) for i in range(5)))
+            self.assertEqual(self.backend.batches, [5])
+        finally:
+            cache.close()
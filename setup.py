@@ -74,8 +74,8 @@ if __name__ == '__main__':  # ``import setup`` doesn't trigger setup().
           long_description=readme,
           classifiers=['Development Status :: 4 - Beta',
                        'License :: OSI Approved :: BSD License',
-                       'Programming Language :: Python :: 2.7',
-                       'Programming Language :: Python :: 2.6',
+                       'Programming Language :: Python :: 3',
+                       'Programming Language :: Python :: 3 :: Only',
                        'Framework :: Django',
                        ],
           keywords='cache',
@@ -87,6 +87,7 @@ if __name__ == '__main__':  # ``import setup`` doesn't trigger setup().
           namespace_packages=namespace_packages(NAME),
           include_package_data=True,
           zip_safe=False,
+          python_requires='>=3.8',
           install_requires=requirements,
           dependency_links=dependency_links,
           entry_points=entry_points,